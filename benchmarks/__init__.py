@@ -0,0 +1,2 @@
+''' Offline benchmarks: a local Polygon stub server, synthetic bars and the benchmark runner.
+See run.py. '''
@@ -0,0 +1,256 @@
+''' Offline benchmarks of the ingestion pipeline.
+
+Polygon is replaced by the local stub server and the bars by synthetic sessions,
+so runs are repeatable without an api key or network. The SQL benchmarks need a
+throwaway Postgres (--database-url); they work in a schema of their own, which is
+dropped afterwards. Results are written as JSON, and --compare prints the change
+against an earlier results file.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --database-url postgresql://user:pw@localhost/scratch
+    python -m benchmarks.run --compare benchmarks/results/previous.json --max-regression 0.2
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+# ANSI color formatting
+from termcolor import colored
+
+from data_collection import backtest, grouped_daily, pyramid
+from data_collection.metrics import hod_volbo_5mins_high
+from data_collection.polygon_client import PolygonClient, aggregates_to_frame
+
+from . import synthetic
+from .stub_server import StubPolygonServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+DAY = '2023-03-03'
+
+def measure(fn, repeat=5, number=1, items=None):
+    ''' Time fn after one warm-up call. items is the work done per call (rows, requests, ...)
+    for a throughput figure '''
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    result = {'repeat': repeat, 'number': number, 'min_s': min(times), 'median_s': statistics.median(times),
+              'mean_s': statistics.fmean(times), 'max_s': max(times)}
+    if items:
+        result['items'] = items
+        result['items_per_s'] = items / result['median_s']
+    return result
+
+def bench_parse(repeat):
+    ''' Polygon json results to the bar DataFrame '''
+    one_day = {'results': synthetic.polygon_aggregates(DAY)}
+    month = {'results': [bar for i, day in enumerate(synthetic.trading_days('2023-03-01', 21))
+                         for bar in synthetic.polygon_aggregates(day, seed=i)]}
+    return {
+        'parse_1_day': measure(lambda: aggregates_to_frame(one_day), repeat, 20, len(one_day['results'])),
+        'parse_21_days': measure(lambda: aggregates_to_frame(month), repeat, 2, len(month['results'])),
+    }
+
+def bench_fetch(repeat, latency, workers):
+    ''' Minute bars through the client and the stub: single day, paged range, rate-limited '''
+    results = {}
+    with StubPolygonServer(latency=latency) as stub:
+        client = PolygonClient('bench', base_url=stub.url, backoff=0.001)
+        results['fetch_1_day'] = measure(lambda: client.aggregates('SYN', 'minute', DAY, DAY), repeat, 5)
+        stub.reset_counters()
+        results['fetch_3_months_paged'] = measure(
+            lambda: client.aggregates('SYN', 'minute', '2023-01-02', '2023-03-31', limit=20000), repeat)
+        results['fetch_3_months_paged']['requests'] = stub.requests // (repeat + 1)
+        results['fetch_3_months_paged']['bytes'] = stub.bytes_sent // (repeat + 1)
+
+        days = synthetic.trading_days('2023-01-02', 40)
+
+        def fetch_concurrently():
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda day: client.aggregates('SYN', 'minute', day, day), days))
+        results[f'fetch_40_days_{workers}_workers'] = measure(fetch_concurrently, repeat, 1, len(days))
+
+    with StubPolygonServer(latency=latency, rate_limit_every=4) as stub:
+        client = PolygonClient('bench', base_url=stub.url, backoff=0.001)
+        results['fetch_1_day_every_4th_429'] = measure(lambda: client.aggregates('SYN', 'minute', DAY, DAY), repeat, 5)
+        results['fetch_1_day_every_4th_429']['rate_limited'] = stub.rate_limited
+
+    with StubPolygonServer(latency=latency) as stub:
+        client = PolygonClient('bench', base_url=stub.url)
+        results['grouped_day_pair'] = measure(lambda: grouped_daily.day_pair(client, DAY, '2023-03-02'),
+                                              repeat, 1, stub.n_tickers)
+    return results
+
+def bench_compute(repeat):
+    ''' Breakout metrics and the bar pyramid, which replaced timeframe_resample_plot '''
+    one_day = synthetic.minute_bars(DAY)
+    batch = synthetic.ticker_days([f'SYN{i}' for i in range(50)], synthetic.trading_days('2023-03-01', 5))
+    cache = pyramid.PyramidCache()
+    return {
+        'metrics_1_day': measure(lambda: hod_volbo_5mins_high(one_day), repeat, 20, len(one_day)),
+        'metrics_250_ticker_days': measure(lambda: hod_volbo_5mins_high(batch), repeat, 1, len(batch)),
+        'pyramid_1_day': measure(lambda: pyramid.build_pyramid(one_day), repeat, 10, len(one_day)),
+        'pyramid_cache_hit': measure(lambda: cache.levels('SYN', DAY, one_day), repeat, 1000),
+    }
+
+def bench_backtest(repeat, n_days=2000):
+    ''' One rule set and a 48 combination sweep over a panel of n_days synthetic ticker-days '''
+    days = synthetic.trading_days('2023-01-02', 20)
+    batch = synthetic.ticker_days([f'SYN{i}' for i in range(n_days // len(days))], days)
+    panel = backtest.Panel.from_bars(batch)
+    grid = {'stop': [0.01, 0.02, 0.05, 0.1], 'target': [0, 0.05, 0.1, 0.2], 'latest_entry': ['10:00', '11:00', '16:00']}
+    return {
+        f'backtest_simulate_{len(panel)}_days': measure(lambda: backtest.simulate(panel), repeat, 1, len(panel)),
+        f'backtest_sweep_48_x_{len(panel)}_days': measure(lambda: backtest.sweep(panel, grid, workers=1), repeat, 1,
+                                                          48 * len(panel)),
+    }
+
+def bench_sql(repeat, database_url):
+    ''' primary_sheet + one_min_data + aggregate writes, the duplicate check and a streamed
+    range load, in a throwaway schema '''
+    from sqlalchemy import create_engine, text
+    from data_collection import store
+
+    schema = f'bench_{os.getpid()}'
+    admin = create_engine(database_url)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA {schema}'))
+    cnx = create_engine(database_url, connect_args={'options': f'-csearch_path={schema}'})
+    try:
+        # create_table.sql is run through a raw cursor, its comments contain '%'
+        with open(os.path.join(REPO_DIR, 'create_table.sql')) as f:
+            schema_sql = f.read()
+        with cnx.begin() as conn:
+            conn.connection.cursor().execute(schema_sql)
+
+        one_day = synthetic.minute_bars(DAY)
+        levels = pyramid.build_pyramid(one_day)
+        counter = iter(range(10 ** 6))
+
+        def store_day():
+            ticker = f'B{next(counter)}'
+            row = pd.DataFrame([synthetic.primary_sheet_row(ticker, DAY)])
+            store.store_ticker_day(cnx, row, one_day, ticker, levels=levels)
+
+        def store_batch():
+            ticker_days = []
+            for _ in range(10):
+                ticker = f'B{next(counter)}'
+                ticker_days.append((pd.DataFrame([synthetic.primary_sheet_row(ticker, DAY)]), one_day, ticker, levels))
+            store.store_ticker_days(cnx, ticker_days)
+
+        results = {
+            'store_ticker_day': measure(store_day, repeat, 3, len(one_day)),
+            'store_10_ticker_days_batch': measure(store_batch, repeat, 1, 10 * len(one_day)),
+            'is_stored': measure(lambda: store.is_stored(cnx, 'B0', DAY), repeat, 50),
+            'read_pyramid': measure(lambda: store.read_pyramid(cnx, 'B0', DAY), repeat, 5),
+        }
+
+        month = synthetic.trading_days('2023-03-01', 21)
+        frames = [synthetic.minute_bars(day, seed=i) for i, day in enumerate(month)]
+        results['stream_21_days'] = measure(
+            lambda: store.stream_one_min_data(cnx, 'RANGE', iter(frames), month[0], month[-1]),
+            repeat, 1, sum(len(frame) for frame in frames))
+        return results
+    finally:
+        cnx.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+        admin.dispose()
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=REPO_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'pandas': pd.__version__, 'numpy': np.__version__}
+
+def compare(results, previous, max_regression=None):
+    ''' Print the median change of every benchmark in both runs. Returns the benchmarks
+    slower than max_regression (0.2 = 20%) '''
+    regressions = []
+    for name, result in results.items():
+        old = previous.get(name)
+        if not old or not result:
+            continue
+        change = result['median_s'] / old['median_s'] - 1
+        line = f'{name:32} {old["median_s"] * 1e3:10.3f} ms -> {result["median_s"] * 1e3:10.3f} ms {change:+8.1%}'
+        if max_regression is not None and change > max_regression:
+            regressions.append(name)
+            print(colored(line, 'red'))
+        else:
+            print(line)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the ingestion pipeline')
+    parser.add_argument('--only', nargs='+', choices=['parse', 'fetch', 'compute', 'backtest', 'sql'],
+                        help='groups to run, all by default (sql needs --database-url)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed repeats per benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='stub server latency per request in seconds')
+    parser.add_argument('--workers', type=int, default=8, help='threads of the concurrent fetch benchmark')
+    parser.add_argument('--database-url', help='throwaway Postgres for the sql benchmarks')
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/<timestamp>.json')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--max-regression', type=float,
+                        help='exit with 1 if a median is slower than this fraction vs --compare')
+    args = parser.parse_args(argv)
+
+    groups = args.only or ['parse', 'fetch', 'compute', 'backtest', 'sql']
+    results = {}
+    for group in groups:
+        if group == 'sql' and not args.database_url:
+            print('Skipping the sql benchmarks, no --database-url')
+            continue
+        print(colored(f'Running {group} benchmarks', 'cyan'))
+        if group == 'parse':
+            results.update(bench_parse(args.repeat))
+        elif group == 'fetch':
+            results.update(bench_fetch(args.repeat, args.latency, args.workers))
+        elif group == 'compute':
+            results.update(bench_compute(args.repeat))
+        elif group == 'backtest':
+            results.update(bench_backtest(args.repeat))
+        elif group == 'sql':
+            results.update(bench_sql(args.repeat, args.database_url))
+
+    for name, result in results.items():
+        throughput = f'{result["items_per_s"]:14,.0f} items/s' if 'items_per_s' in result else ''
+        print(f'{name:32} {result["median_s"] * 1e3:10.3f} ms {throughput}')
+
+    report = {**environment(), 'args': {k: v for k, v in vars(args).items() if k != 'database_url'},
+              'results': results}
+    output = args.output or os.path.join(RESULTS_DIR, f'{report["timestamp"].replace(":", "")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+        if compare(results, previous, args.max_regression):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
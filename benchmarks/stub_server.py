@@ -0,0 +1,188 @@
+''' Local stand-in for api.polygon.io.
+
+Serves the aggregate, grouped daily and ticker reference endpoints the bot uses.
+A request whose path has a recorded response under fixtures_dir
+({fixtures_dir}/{url path}.json) is replayed, anything else is answered with
+synthetic data. Aggregates honour limit and are paged with next_url like Polygon.
+Every request can be delayed by latency seconds, and every rate_limit_every-th
+request answered with a 429, to exercise the client's retries.
+
+    with StubPolygonServer(latency=0.02, rate_limit_every=10) as stub:
+        client = PolygonClient('key', base_url=stub.url)
+
+Record a real response once with record_fixture(client, path, fixtures_dir).
+'''
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from data_collection import bars
+
+from . import synthetic
+
+def day_of(date):
+    ''' YYYY-MM-DD of a Polygon from / to argument, a date or a millisecond timestamp '''
+    if not date.isdigit():
+        return date
+    return pd.Timestamp(int(date), unit='ms', tz='UTC').tz_convert(bars.EASTERN).strftime('%Y-%m-%d')
+
+def fixture_path(fixtures_dir, path):
+    return os.path.join(fixtures_dir, path.strip('/') + '.json')
+
+def record_fixture(client, path, fixtures_dir, params=None):
+    ''' Save a real Polygon response of path (e.g. /v2/aggs/ticker/AAPL/range/1/minute/2023-03-03/2023-03-03)
+    for the stub to replay. Aggregates should be requested with a limit that fits the range in one page '''
+    data = client.get_json(f'{client.base_url}{path}', params=params)
+    data.pop('next_url', None)
+    target = fixture_path(fixtures_dir, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w') as f:
+        json.dump(data, f)
+    return target
+
+class StubPolygonServer:
+    ''' Threaded HTTP server answering like Polygon, see the module docstring '''
+
+    def __init__(self, fixtures_dir=None, latency=0.0, rate_limit_every=0, retry_after=0, n_tickers=5000):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.n_tickers = n_tickers
+        self.requests = 0
+        self.rate_limited = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        # Synthetic ranges are generated once and then paged from memory
+        self.generated = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = self.rate_limited = self.bytes_sent = 0
+
+    def count_request(self):
+        ''' Count a request, True if it should be answered with a 429 '''
+        with self.lock:
+            self.requests += 1
+            limited = self.rate_limit_every > 0 and self.requests % self.rate_limit_every == 0
+            self.rate_limited += limited
+        return limited
+
+    def recorded(self, path):
+        if self.fixtures_dir is None:
+            return None
+        target = fixture_path(self.fixtures_dir, path)
+        if not os.path.exists(target):
+            return None
+        with open(target) as f:
+            return json.load(f)
+
+    def respond(self, path, query):
+        ''' (status, json body) of a GET '''
+        parts = path.strip('/').split('/')
+        data = self.recorded(path)
+        # /v2/aggs/ticker/{symbol}/range/1/{timespan}/{start}/{end}
+        if parts[:3] == ['v2', 'aggs', 'ticker'] and len(parts) == 9:
+            symbol, timespan, start, end = parts[3], parts[6], parts[7], parts[8]
+            if data is None:
+                data = {'ticker': symbol, 'results': self.synthetic_aggregates(symbol, timespan, start, end)}
+            return 200, self.page(path, data, query)
+        # /v2/aggs/grouped/locale/us/market/stocks/{date}
+        if parts[:3] == ['v2', 'aggs', 'grouped']:
+            day = parts[-1]
+            if data is None:
+                results = synthetic.polygon_grouped(day, self.n_tickers) if pd.Timestamp(day).dayofweek < 5 else []
+                data = {'results': results, 'resultsCount': len(results)}
+            return 200, data
+        # /v3/reference/tickers/{symbol}
+        if parts[:3] == ['v3', 'reference', 'tickers'] and len(parts) == 4:
+            return 200, data or {'results': synthetic.ticker_details(parts[3])}
+        # /v3/reference/tickers
+        if parts[:3] == ['v3', 'reference', 'tickers']:
+            data = data or {'results': [{'ticker': f'SYN{i}'} for i in range(self.n_tickers)]}
+            return 200, self.page(path, data, query)
+        return 404, {'status': 'NOT_FOUND'}
+
+    def synthetic_aggregates(self, symbol, timespan, start, end):
+        # Like Polygon, from / to may also be millisecond timestamps (the live polling)
+        if start.isdigit() or end.isdigit():
+            first = int(start) if start.isdigit() else 0
+            last = int(end) if end.isdigit() else float('inf')
+            results = self.synthetic_aggregates(symbol, timespan, day_of(start), day_of(end))
+            return [bar for bar in results if first <= bar['t'] <= last]
+        key = (symbol, timespan, start, end)
+        if key not in self.generated:
+            seed = sum(map(ord, symbol))
+            days = [day.strftime('%Y-%m-%d') for day in pd.bdate_range(start, end)]
+            if timespan == 'minute':
+                results = [bar for i, day in enumerate(days) for bar in synthetic.polygon_aggregates(day, seed + i)]
+            else:
+                results = [synthetic.polygon_daily(day, seed + i) for i, day in enumerate(days)]
+            self.generated[key] = results
+        return self.generated[key]
+
+    def page(self, path, data, query):
+        ''' Cut results to limit from cursor on and link the rest with next_url '''
+        results = data.get('results') or []
+        limit = int(query.get('limit', [50000])[0])
+        cursor = int(query.get('cursor', [0])[0])
+        body = {**data, 'results': results[cursor:cursor + limit]}
+        body['resultsCount'] = len(body['results'])
+        if cursor + limit < len(results):
+            body['next_url'] = f'{self.url}{path}?cursor={cursor + limit}&limit={limit}'
+        return body
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.count_request():
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(stub.retry_after))
+                    self.end_headers()
+                    return
+                status, data = stub.respond(url.path, parse_qs(url.query))
+                payload = json.dumps(data).encode()
+                with stub.lock:
+                    stub.bytes_sent += len(payload)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
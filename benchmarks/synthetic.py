@@ -0,0 +1,102 @@
+''' Synthetic market data for the benchmarks.
+
+Minute bars follow a seeded random walk over the 04:00-19:59 Eastern session with
+a volume burst after the open, so the breakout metrics have something to find.
+Every generator is deterministic for a given seed. '''
+
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+from data_collection import bars
+
+SESSION_START = '04:00'
+SESSION_END = '19:59'
+
+def session_minutes(day):
+    ''' Eastern minute timestamps of one extended-hours session '''
+    return pd.date_range(f'{day} {SESSION_START}', f'{day} {SESSION_END}', freq='1min', tz=bars.EASTERN)
+
+def trading_days(start_date, n_days):
+    ''' n_days weekdays from start_date on, as YYYY-MM-DD strings '''
+    return [day.strftime('%Y-%m-%d') for day in pd.bdate_range(start_date, periods=n_days)]
+
+def minute_arrays(day, seed=0, start_price=10.0):
+    ''' Timestamps and OHLCV arrays of one synthetic session '''
+    rng = np.random.default_rng(seed)
+    dates = session_minutes(day)
+    n = len(dates)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.001, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    # Thin pre-market, a burst after the open and a fading afternoon
+    minutes = dates.hour * 60 + dates.minute
+    profile = np.where(minutes < 570, 0.05, np.where(minutes < 600, 3.0, 1.0))
+    volume = rng.poisson(2000 * profile).astype('int64') + 1
+    vwap = (open_ + high + low + close) / 4
+    trades = np.maximum(volume // 50, 1).astype('int32')
+    return dates, open_, high, low, close, volume, vwap, trades
+
+def minute_bars(day, seed=0, start_price=10.0):
+    ''' One session of 1min bars in the bars.py schema, like PolygonClient.aggregates returns '''
+    dates, open_, high, low, close, volume, vwap, trades = minute_arrays(day, seed, start_price)
+    frame = pd.DataFrame({'Volume': volume, 'Vwap': vwap, 'Open': open_, 'Close': close,
+                          'High': high, 'Low': low, 'N_of_trades': trades, 'Date': dates})
+    return bars.to_bar_schema(frame)
+
+def ticker_days(tickers, days, seed=0):
+    ''' 1min bars of every ticker on every day in one frame with a 'ticker' column '''
+    frames = []
+    for i, ticker in enumerate(tickers):
+        for j, day in enumerate(days):
+            frame = minute_bars(day, seed=seed + i * len(days) + j, start_price=5.0 + i % 50)
+            frame.insert(0, 'ticker', ticker)
+            frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def polygon_aggregates(day, seed=0, start_price=10.0):
+    ''' The raw Polygon 'results' list of one synthetic 1min session '''
+    dates, open_, high, low, close, volume, vwap, trades = minute_arrays(day, seed, start_price)
+    timestamps = dates.as_unit('ms').asi8
+    return [{'v': int(v), 'vw': round(float(vw), 4), 'o': round(float(o), 4), 'c': round(float(c), 4),
+             'h': round(float(h), 4), 'l': round(float(l), 4), 't': int(t), 'n': int(n)}
+            for v, vw, o, c, h, l, t, n in zip(volume, vwap, open_, close, high, low, timestamps, trades)]
+
+def polygon_daily(day, seed=0, start_price=10.0):
+    ''' The raw Polygon daily bar of one synthetic session '''
+    dates, open_, high, low, close, volume, vwap, trades = minute_arrays(day, seed, start_price)
+    return {'v': int(volume.sum()), 'vw': round(float(np.average(vwap, weights=volume)), 4),
+            'o': round(float(open_[0]), 4), 'c': round(float(close[-1]), 4), 'h': round(float(high.max()), 4),
+            'l': round(float(low.min()), 4), 't': int(pd.Timestamp(day, tz=bars.EASTERN).value // 1_000_000),
+            'n': int(trades.sum())}
+
+def polygon_grouped(day, n_tickers=5000, seed=0):
+    ''' The raw Polygon grouped daily results of a synthetic market of n_tickers '''
+    rng = np.random.default_rng(seed + pd.Timestamp(day).dayofyear)
+    close = rng.uniform(1, 200, n_tickers)
+    open_ = close * rng.lognormal(0, 0.05, n_tickers)
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.1, n_tickers))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.1, n_tickers))
+    volume = rng.integers(1_000, 50_000_000, n_tickers)
+    t = int(pd.Timestamp(day, tz=bars.EASTERN).value // 1_000_000)
+    return [{'T': f'SYN{i}', 'v': int(volume[i]), 'vw': round(float((high[i] + low[i] + close[i]) / 3), 4),
+             'o': round(float(open_[i]), 4), 'c': round(float(close[i]), 4), 'h': round(float(high[i]), 4),
+             'l': round(float(low[i]), 4), 't': t, 'n': int(volume[i] // 100)} for i in range(n_tickers)]
+
+def ticker_details(ticker, seed=0):
+    ''' A Polygon ticker details 'results' object '''
+    rng = np.random.default_rng(seed + sum(map(ord, ticker)))
+    return {'ticker': ticker, 'market': 'stocks', 'primary_exchange': 'XNAS',
+            'weighted_shares_outstanding': int(rng.integers(1_000_000, 500_000_000))}
+
+def primary_sheet_row(ticker, day, seed=0):
+    ''' A plausible primary_sheet row for ticker on day '''
+    daily = polygon_daily(day, seed)
+    return {'weekday': pd.Timestamp(day).day_name(), 'date': day, 'ticker': ticker, 'exchange': 'Nasdaq',
+            'industry': 'Technology', 'so': ticker_details(ticker, seed)['weighted_shares_outstanding'],
+            'dv': daily['v'], 'prior_day_vol': daily['v'], 'prior_day_vwap': daily['vw'],
+            'b_run_up_low': daily['l'], 'run_up_high': daily['h'], 'prev_close': daily['o'],
+            'open': daily['o'], 'low': daily['l'], 'five_mins_high': daily['h'], 'high': daily['h'],
+            'close': daily['c'], 'vol_b4_bo': daily['v'] // 10, 'hod': '09:45:00'}
@@ -17,7 +17,8 @@ five_mins_high FLOAT NOT NULL,
 high FLOAT NOT NULL,
 close FLOAT NOT NULL,
 vol_b4_bo BIGINT NOT NULL,
-hod TEXT NOT NULL);
+hod TEXT NOT NULL,
+UNIQUE (ticker, date));
 
 ALTER TABLE primary_sheet ADD COLUMN mkt_cap BIGINT GENERATED ALWAYS AS (so*b_run_up_low) STORED;
 
@@ -29,6 +30,15 @@ ALTER TABLE primary_sheet ADD COLUMN prior_day_dollar_vol BIGINT GENERATED ALWAY
 
 ALTER TABLE primary_sheet ADD COLUMN total_runup FLOAT GENERATED ALWAYS AS ((run_up_high-b_run_up_low)/b_run_up_low) STORED;
 
+-- For a primary_sheet created before the unique constraint was added:
+-- ALTER TABLE primary_sheet ADD CONSTRAINT primary_sheet_ticker_date_key UNIQUE (ticker, date);
+
+-- Ids are assigned by the id sequence (INSERT ... RETURNING id). For a primary_sheet whose ids were
+-- set by the application, move the sequence past them once:
+-- SELECT setval(pg_get_serial_sequence('primary_sheet', 'id'), COALESCE(max(id), 0) + 1, false) FROM primary_sheet;
+
+-- one_min_data is range-partitioned by month on date. store.py creates the monthly
+-- partitions (one_min_data_YYYY_MM) on demand before loading bars with COPY.
 CREATE TABLE "one_min_data" (stock_one_min_id INT,
 						  ticker TEXT NOT NULL,
 						  date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
@@ -40,4 +50,82 @@ CREATE TABLE "one_min_data" (stock_one_min_id INT,
 						  vwap FLOAT NOT NULL,
 					      n_of_trades INT,
 						  FOREIGN KEY(stock_one_min_id) REFERENCES
-						 primary_sheet (id));
+						 primary_sheet (id))
+						 PARTITION BY RANGE (date);
+
+-- Indexes on the parent are created on every partition
+CREATE INDEX one_min_data_ticker_date_idx ON one_min_data (ticker, date);
+CREATE INDEX one_min_data_stock_one_min_id_idx ON one_min_data (stock_one_min_id);
+CREATE INDEX one_min_data_date_brin ON one_min_data USING BRIN (date);
+
+-- Bar pyramid levels above 1min (see pyramid.py), written together with one_min_data
+CREATE TABLE "five_min_data" (stock_one_min_id INT REFERENCES primary_sheet (id),
+						  ticker TEXT NOT NULL,
+						  date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+						  open FLOAT NOT NULL,
+						  high FLOAT NOT NULL,
+						  low FLOAT NOT NULL,
+						  close FLOAT NOT NULL,
+						  volume BIGINT NOT NULL);
+CREATE TABLE "fifteen_min_data" (LIKE five_min_data INCLUDING ALL);
+ALTER TABLE fifteen_min_data ADD FOREIGN KEY (stock_one_min_id) REFERENCES primary_sheet (id);
+CREATE TABLE "thirty_min_data" (LIKE five_min_data INCLUDING ALL);
+ALTER TABLE thirty_min_data ADD FOREIGN KEY (stock_one_min_id) REFERENCES primary_sheet (id);
+CREATE TABLE "one_hour_data" (LIKE five_min_data INCLUDING ALL);
+ALTER TABLE one_hour_data ADD FOREIGN KEY (stock_one_min_id) REFERENCES primary_sheet (id);
+
+CREATE INDEX five_min_data_ticker_date_idx ON five_min_data (ticker, date);
+CREATE INDEX fifteen_min_data_ticker_date_idx ON fifteen_min_data (ticker, date);
+CREATE INDEX thirty_min_data_ticker_date_idx ON thirty_min_data (ticker, date);
+CREATE INDEX one_hour_data_ticker_date_idx ON one_hour_data (ticker, date);
+CREATE INDEX five_min_data_stock_one_min_id_idx ON five_min_data (stock_one_min_id);
+CREATE INDEX fifteen_min_data_stock_one_min_id_idx ON fifteen_min_data (stock_one_min_id);
+CREATE INDEX thirty_min_data_stock_one_min_id_idx ON thirty_min_data (stock_one_min_id);
+CREATE INDEX one_hour_data_stock_one_min_id_idx ON one_hour_data (stock_one_min_id);
+
+-- Ticker reference data (reference_data.py), read before calling Polygon or Yahoo
+CREATE TABLE "ticker_reference" (ticker TEXT NOT NULL,
+as_of DATE NOT NULL,
+primary_exchange TEXT,
+market TEXT,
+weighted_shares_outstanding BIGINT,
+sector TEXT,
+PRIMARY KEY (ticker, as_of));
+
+-- Breakout metrics of every stored ticker-day, computed from one_min_data with window functions
+-- (same definitions as metrics.hod_volbo_5mins_high). scanner.py refreshes it and copies it into
+-- primary_sheet. The unique index lets it be refreshed CONCURRENTLY.
+CREATE MATERIALIZED VIEW breakout_metrics AS
+WITH day_bars AS (
+    SELECT ticker, date::date AS day, date, high, volume,
+           max(high) FILTER (WHERE date::time >= '09:30' AND date::time < '09:35')
+               OVER (PARTITION BY ticker, date::date) AS five_mins_high,
+           max(high) FILTER (WHERE date::time BETWEEN '09:30' AND '16:00')
+               OVER (PARTITION BY ticker, date::date) AS day_high,
+           sum(volume) OVER (PARTITION BY ticker, date::date ORDER BY date
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS vol_before
+    FROM one_min_data
+)
+SELECT ticker, day AS date,
+       max(five_mins_high) AS five_mins_high,
+       min(date) FILTER (WHERE date::time BETWEEN '09:30' AND '16:00' AND high = day_high) AS hod,
+       min(date) FILTER (WHERE date::time BETWEEN '09:35' AND '16:00' AND high > five_mins_high) AS breakout,
+       COALESCE((array_agg(vol_before ORDER BY date)
+                 FILTER (WHERE date::time BETWEEN '09:35' AND '16:00' AND high > five_mins_high))[1], 0)::bigint AS vol_b4_bo
+FROM day_bars
+GROUP BY ticker, day;
+CREATE UNIQUE INDEX breakout_metrics_ticker_date_idx ON breakout_metrics (ticker, date);
+
+-- For a one_min_data created before partitioning, move the rows over once:
+-- ALTER TABLE one_min_data RENAME TO one_min_data_unpartitioned;
+-- (run the CREATE TABLE and CREATE INDEX statements above)
+-- DO $$
+-- DECLARE m date;
+-- BEGIN
+--   FOR m IN SELECT DISTINCT date_trunc('month', date)::date FROM one_min_data_unpartitioned LOOP
+--     EXECUTE format('CREATE TABLE one_min_data_%s PARTITION OF one_min_data FOR VALUES FROM (%L) TO (%L)',
+--                    to_char(m, 'YYYY_MM'), m, (m + interval '1 month')::date);
+--   END LOOP;
+-- END $$;
+-- INSERT INTO one_min_data SELECT * FROM one_min_data_unpartitioned;
+-- DROP TABLE one_min_data_unpartitioned;
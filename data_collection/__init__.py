@@ -0,0 +1,6 @@
+''' Polygon.io data collection for the 5mins high breakout strategy.
+
+Fetch (polygon_client, fetch), metrics, store, plot and the bar pyramid are importable
+without side effects; `python -m data_collection` is the command line interface.
+Heavy dependencies (plotly, selenium, bs4, IPython) are imported only by the
+functions that use them. '''
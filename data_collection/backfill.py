@@ -0,0 +1,167 @@
+''' Non-interactive batch backfill.
+
+Reads (ticker, start_date, end_date) jobs from a csv file, fetches them concurrently
+through one pooled, rate-limited Polygon client and stores every ticker-day the same way
+option 1 of the menu does, --batch-size ticker-days per transaction. start_date is day -1
+and end_date is day +0. Row ids come from Postgres, so several backfills can run at once.
+
+The run-up columns of primary_sheet are entered by hand in option 1, so the jobs file
+needs b_run_up_low and run_up_high columns for rows to be stored; rows without them
+are rejected before anything is fetched. With --dry-run nothing is stored and the
+computed rows are written to --output instead.
+
+    python -m data_collection backfill jobs.csv --workers 8 --calls-per-minute 300
+'''
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Data analysis and manipulation
+import pandas as pd
+
+# ANSI color formatting
+from termcolor import colored
+
+from . import store
+from .fetch import client_from_config, fetch_ticker_day
+from .grouped_daily import day_pair
+
+# Hand-entered primary_sheet columns, NOT NULL in the table
+RUN_UP_COLUMNS = ['b_run_up_low', 'run_up_high']
+
+def read_jobs(path, require_run_up=False):
+    ''' Load the jobs file, one ticker-day per row. With require_run_up (the rows are to be
+    stored), jobs without a numeric b_run_up_low and run_up_high are rejected here, before
+    their bars are requested. Returns (jobs, DataFrame of rejected jobs with an error column) '''
+    jobs = pd.read_csv(path, dtype={'ticker':str, 'start_date':str, 'end_date':str})
+    missing = {'ticker','start_date','end_date'} - set(jobs.columns)
+    if missing:
+        raise ValueError(f'jobs file is missing columns: {", ".join(sorted(missing))}')
+    jobs['ticker'] = jobs['ticker'].str.strip().str.upper()
+    jobs = jobs.drop_duplicates(subset=['ticker','end_date']).reset_index(drop=True)
+    if not require_run_up:
+        return jobs, jobs.iloc[:0].assign(error=None)
+    run_up = jobs.reindex(columns=RUN_UP_COLUMNS).apply(pd.to_numeric, errors='coerce')
+    incomplete = run_up.isna().any(axis=1)
+    rejected = jobs.loc[incomplete].assign(error='b_run_up_low and run_up_high are required to store the row')
+    return jobs.loc[~incomplete].assign(**run_up.loc[~incomplete]).reset_index(drop=True), rejected
+
+def fetch_job(client, job, cnx=None, day_pairs=None):
+    ''' Download and compute the primary_sheet row of one job '''
+    daily = None
+    if day_pairs is not None:
+        pair = day_pairs.get((job['start_date'], job['end_date']))
+        if pair is not None and job['ticker'] in pair.index:
+            daily = pair.loc[job['ticker']]
+    return fetch_ticker_day(client, job['ticker'], job['start_date'], job['end_date'], cnx,
+                            job.get('b_run_up_low'), job.get('run_up_high'), daily)
+
+def grouped_day_pairs(client, jobs):
+    ''' grouped_daily.day_pair of every (start_date, end_date) of the jobs: two requests per
+    pair of dates instead of one daily request per job '''
+    dates = jobs[['start_date','end_date']].drop_duplicates().itertuples(index=False)
+    return {(start, end): day_pair(client, end, start) for start, end in dates}
+
+def store_batch(cnx, batch, on_conflict, rows, failed):
+    ''' Store (label, job, row, df_plot) items in one transaction. If it fails, the items are
+    stored one by one so a bad ticker-day only fails itself '''
+    ticker_days = [(pd.DataFrame.from_dict([row]), df_plot, row['ticker'], None) for _, _, row, df_plot in batch]
+    try:
+        primary_keys = store.store_ticker_days(cnx, ticker_days, on_conflict)
+    except Exception:
+        if len(batch) == 1:
+            raise
+        for item in batch:
+            try:
+                store_batch(cnx, [item], on_conflict, rows, failed)
+            except Exception as e:
+                label, job, _, _ = item
+                failed.append({**job, 'error': str(e)})
+                print(colored(f'{label} failed: {e}', 'red'))
+        return
+    for (label, _, row, _), primary_key in zip(batch, primary_keys):
+        rows.append(row)
+        print(f'{label} {"already stored" if primary_key is None else "ok"}')
+
+def run_backfill(jobs, client, cnx=None, workers=8, on_conflict='skip', grouped=False, batch_size=20):
+    ''' Fetch every job concurrently. Rows are stored from this thread as they complete,
+    batch_size ticker-days per transaction. With grouped, the daily bars come from the
+    grouped daily bars of each date. Returns (list of rows, DataFrame of failed jobs) '''
+    rows, failed, batch = [], [], []
+    day_pairs = grouped_day_pairs(client, jobs) if grouped else None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch_job, client, job, cnx, day_pairs): job for job in jobs.to_dict('records')}
+        for done, future in enumerate(as_completed(futures), start=1):
+            job = futures[future]
+            label = f'[{done}/{len(futures)}] {job["ticker"]} {job["end_date"]}'
+            try:
+                row, df_plot = future.result()
+                if cnx is None:
+                    rows.append(row)
+                    print(f'{label} ok')
+                    continue
+                if pd.isna(row['b_run_up_low']) or pd.isna(row['run_up_high']):
+                    raise ValueError('b_run_up_low and run_up_high are required to store the row')
+                batch.append((label, job, row, df_plot))
+            except Exception as e:
+                failed.append({**job, 'error': str(e)})
+                print(colored(f'{label} failed: {e}', 'red'))
+            if len(batch) >= batch_size:
+                store_batch(cnx, batch, on_conflict, rows, failed)
+                batch = []
+    if batch:
+        store_batch(cnx, batch, on_conflict, rows, failed)
+    return rows, pd.DataFrame(failed)
+
+def add_arguments(parser):
+    parser.add_argument('jobs', help='csv with ticker,start_date,end_date[,b_run_up_low,run_up_high] columns')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent jobs')
+    parser.add_argument('--calls-per-minute', type=float,
+                        help='Polygon rate limit, defaults to POLYGON_CALLS_PER_MINUTE in sql_config')
+    parser.add_argument('--retries', type=int, default=5, help='retries per request for 429 and server errors')
+    parser.add_argument('--on-conflict', choices=store.ON_CONFLICT, default='skip',
+                        help='skip ticker-days already in primary_sheet or overwrite them')
+    parser.add_argument('--batch-size', type=int, default=20, help='ticker-days stored per transaction')
+    parser.add_argument('--grouped-daily', action='store_true',
+                        help='take the daily bars of every job from one grouped daily request per date')
+    parser.add_argument('--dry-run', action='store_true', help='do not store anything, only compute the rows')
+    parser.add_argument('--output', help='write the computed rows to this csv')
+    parser.add_argument('--failed', default='backfill_failed.csv', help='write failed jobs to this csv for a rerun')
+
+def run(args):
+    jobs, rejected = read_jobs(args.jobs, require_run_up=not args.dry_run)
+    for job in rejected.to_dict('records'):
+        print(colored(f'{job["ticker"]} {job["end_date"]} rejected: {job["error"]}', 'red'))
+    client = client_from_config(pool_size=args.workers, calls_per_minute=args.calls_per_minute, retries=args.retries)
+    cnx = None
+    if not args.dry_run:
+        # Fetch workers look up reference data while this thread writes, one connection each
+        cnx = store.engine_from_config(pool_size=args.workers + 1)
+        if args.on_conflict == 'skip':
+            # Skip ticker-days that are already stored
+            stored = store.stored_ticker_dates(cnx, jobs['ticker'], jobs['end_date'])
+            is_stored = [(t, d) in stored for t, d in zip(jobs['ticker'], jobs['end_date'])]
+            if any(is_stored):
+                print(f'Skipping {sum(is_stored)} ticker-days already in primary_sheet')
+            jobs = jobs.loc[[not s for s in is_stored]]
+
+    rows, failed = run_backfill(jobs, client, cnx, workers=args.workers, on_conflict=args.on_conflict,
+                                grouped=args.grouped_daily, batch_size=args.batch_size)
+    if len(rejected):
+        failed = pd.concat([rejected, failed], ignore_index=True)
+
+    if args.output:
+        pd.DataFrame(rows).to_csv(args.output, index=False)
+    if len(failed):
+        failed.to_csv(args.failed, index=False)
+        print(colored(f'{len(failed)} jobs failed, see {args.failed}', 'red', attrs=['bold']))
+    print(colored(f'{len(rows)} of {len(jobs) + len(rejected)} ticker-days done', 'cyan'))
+    return 1 if len(failed) else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill many ticker-days without the interactive menu')
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    sys.exit(main())
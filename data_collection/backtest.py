@@ -0,0 +1,320 @@
+''' Backtest of the 5mins high breakout entry over the stored 1min bars.
+
+The market-hours bars of many ticker-days are loaded into a Panel: one (days x 391)
+float32 array per field on a fixed 9:30-16:00 minute grid, NaN where a minute has no
+bar. Loading from Postgres streams one_min_data in chunks; a Panel saved with save()
+is read back memory-mapped, which is also how the sweep worker processes share it.
+load_dataset_panel() reads the local Parquet mirror (dataset.py) instead of Postgres.
+
+simulate() evaluates one set of rules on every ticker-day at once with NumPy:
+
+- entry on the first candle from the end of the opening range (range_minutes, 5 is the
+  5mins high) up to latest_entry whose high clears the range high by entry_buffer, at
+  that level, or at the candle's open if it gapped over it
+- exit at a stop (fraction below the entry), a target (fraction above it) or at the
+  close of the exit_time candle, whichever comes first. Stops and targets are checked
+  from the candle after the entry; a candle touching both counts as stopped out
+- min_gap skips ticker-days whose primary_sheet gap is below it
+
+sweep() runs every combination of a parameter grid in a process pool:
+
+    python -m data_collection backtest --start 2023-01-01 --stop 0.02 0.05 --target 0 0.1 0.2 --latest-entry 10:00 11:00
+    python -m data_collection backtest --start 2023-01-01 --save-panel panel/ --stop 0.05
+    python -m data_collection backtest --panel panel/ --stop 0.02 0.05 --workers 8 --output sweep.csv
+    python -m data_collection backtest --dataset --start 2023-01-01 --stop 0.02 0.05
+'''
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+# ANSI color formatting
+from termcolor import colored
+
+from . import bars, instrument
+from .metrics import MARKET_CLOSE, MARKET_OPEN
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+# One column per market-hours minute, 9:30 to the 16:00 candle
+N_MINUTES = MARKET_CLOSE - MARKET_OPEN + 1
+
+# primary_sheet columns kept with every ticker-day of a Panel
+DAY_COLUMNS = ['id', 'ticker', 'date', 'gap', 'five_mins_high', 'vol_b4_bo', 'prior_day_dollar_vol', 'mkt_cap']
+
+DEFAULT_PARAMS = {'range_minutes': 5, 'entry_buffer': 0.0, 'stop': 0.05, 'target': None,
+                  'latest_entry': '16:00', 'exit_time': '15:59', 'min_gap': None}
+
+def minute_column(clock):
+    ''' Grid column of an 'HH:MM' market time '''
+    hours, minutes = map(int, clock.split(':'))
+    return min(max(hours * 60 + minutes - MARKET_OPEN, 0), N_MINUTES - 1)
+
+class Panel:
+    ''' 1min bars of many ticker-days on the market-hours minute grid. days holds the
+    ticker-days (ticker, date and primary_sheet columns) in row order '''
+
+    def __init__(self, days, arrays):
+        self.days = days.reset_index(drop=True)
+        self.arrays = arrays
+
+    @classmethod
+    def empty(cls, days):
+        days = days.assign(date=pd.to_datetime(days['date']))
+        return cls(days, {field: np.full((len(days), N_MINUTES), np.nan, dtype='float32') for field in FIELDS})
+
+    @classmethod
+    def from_bars(cls, frame, days=None):
+        ''' Panel of 1min bars with ticker, date / Date and OHLCV columns. Without days,
+        every ticker-day in frame is a row '''
+        frame = frame.rename(columns=str.lower)
+        if days is None:
+            dates = bars.wall_clock(frame['date']).dt.normalize()
+            days = pd.DataFrame({'ticker': frame['ticker'], 'date': dates}).drop_duplicates()
+            days = days.sort_values(['date', 'ticker'])
+        panel = cls.empty(days)
+        panel.fill(frame)
+        return panel
+
+    def fill(self, frame):
+        ''' Write a chunk of bars (lowercase columns) into their ticker-day rows. Bars outside
+        market hours or of ticker-days not in the panel are ignored '''
+        dates = bars.wall_clock(pd.to_datetime(frame['date']))
+        column = (dates.dt.hour * 60 + dates.dt.minute - MARKET_OPEN).to_numpy()
+        index = pd.MultiIndex.from_frame(self.days[['ticker', 'date']])
+        row = index.get_indexer(pd.MultiIndex.from_arrays([frame['ticker'], dates.dt.normalize()]))
+        keep = (row >= 0) & (column >= 0) & (column < N_MINUTES)
+        for field in FIELDS:
+            self.arrays[field][row[keep], column[keep]] = frame[field].to_numpy('float32')[keep]
+
+    def __len__(self):
+        return len(self.days)
+
+    def save(self, path):
+        ''' One .npy file per field plus days.csv, for load(path, mmap=True) '''
+        os.makedirs(path, exist_ok=True)
+        for field, array in self.arrays.items():
+            np.save(os.path.join(path, f'{field}.npy'), array)
+        self.days.to_csv(os.path.join(path, 'days.csv'), index=False)
+        with open(os.path.join(path, 'panel.json'), 'w') as f:
+            json.dump({'fields': FIELDS, 'minutes': N_MINUTES, 'days': len(self)}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        ''' A saved Panel, memory-mapped read-only by default '''
+        days = pd.read_csv(os.path.join(path, 'days.csv'), parse_dates=['date'])
+        arrays = {field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode='r' if mmap else None)
+                  for field in FIELDS}
+        return cls(days, arrays)
+
+@instrument.timed('backtest_load')
+def load_panel(cnx, start_date=None, end_date=None, tickers=None, chunksize=500_000):
+    ''' Panel of the primary_sheet ticker-days between start_date and end_date (optionally of
+    some tickers), filled from one_min_data with a server-side cursor chunksize rows at a time '''
+    from sqlalchemy import text
+
+    conditions, params = [], {}
+    if start_date is not None:
+        conditions.append('p.date >= :start')
+        params['start'] = str(start_date)
+    if end_date is not None:
+        conditions.append('p.date <= :end')
+        params['end'] = str(end_date)
+    if tickers:
+        conditions.append('p.ticker = ANY(:tickers)')
+        params['tickers'] = list(tickers)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    days = pd.read_sql(text(f'SELECT {", ".join("p." + c for c in DAY_COLUMNS)} FROM primary_sheet p {where} '
+                            'ORDER BY p.date, p.ticker'), con=cnx, params=params)
+    panel = Panel.empty(days)
+    query = text(f'''SELECT o.ticker, o.date, o.open, o.high, o.low, o.close, o.volume
+                     FROM primary_sheet p
+                     JOIN one_min_data o ON o.ticker = p.ticker AND o.date >= p.date AND o.date < p.date + 1
+                     {where} {"AND" if where else "WHERE"} o.date::time BETWEEN '09:30' AND '16:00' ''')
+    with cnx.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql(query, con=conn, params=params, chunksize=chunksize):
+            panel.fill(chunk)
+    return panel
+
+@instrument.timed('backtest_load')
+def load_dataset_panel(start_date=None, end_date=None, tickers=None, root=None):
+    ''' load_panel() from the Parquet mirror of the database (dataset.py), reading only the
+    needed columns and days '''
+    from . import dataset
+
+    days = dataset.read_frame('primary_sheet', DAY_COLUMNS, start_date, end_date, tickers, root=root)
+    panel = Panel.empty(days.sort_values(['date', 'ticker']))
+    panel.fill(dataset.read_frame('one_min_data', ['ticker', 'date', *FIELDS], start_date, end_date, tickers, root=root))
+    return panel
+
+def first_column(mask):
+    ''' Column of the first True of every row, N_MINUTES where there is none '''
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), N_MINUTES)
+
+def simulate(panel, range_minutes=5, entry_buffer=0.0, stop=0.05, target=None, latest_entry='16:00',
+             exit_time='15:59', min_gap=None):
+    ''' Trades of one set of rules on every ticker-day of panel, as arrays with one value
+    per day: entered, entry / exit column and price, exit reason and return '''
+    high, low = panel.arrays['high'], panel.arrays['low']
+    open_, close = panel.arrays['open'], panel.arrays['close']
+    rows = np.arange(len(panel))
+    columns = np.arange(N_MINUTES)
+    exit_column = minute_column(exit_time)
+
+    # Opening range high, NaN for a day without opening candles (no entry then)
+    level = np.fmax.reduce(high[:, :range_minutes], axis=1).astype('float64') * (1 + entry_buffer)
+    window = (columns >= range_minutes) & (columns <= min(minute_column(latest_entry), exit_column - 1))
+    trigger = window & (high > level[:, None])
+    if min_gap is not None:
+        trigger &= (panel.days['gap'].to_numpy('float64') >= min_gap)[:, None]
+    entry_column = first_column(trigger)
+    entered = entry_column < N_MINUTES
+    entry_column = np.minimum(entry_column, N_MINUTES - 1)
+    entry_open = open_[rows, entry_column]
+    entry_price = np.where(entry_open > level, entry_open, level)
+
+    # Stops and targets from the candle after the entry up to the exit time
+    after = (columns > entry_column[:, None]) & (columns <= exit_column)
+    stop_price = entry_price * (1 - stop) if stop else np.full(len(panel), -np.inf)
+    target_price = entry_price * (1 + target) if target else np.full(len(panel), np.inf)
+    stop_column = first_column(after & (low <= stop_price[:, None]))
+    target_column = first_column(after & (high >= target_price[:, None]))
+    # Otherwise out on the last candle up to the exit time
+    time_column = np.where(~np.isnan(close) & (columns <= exit_column), columns, -1).max(axis=1)
+
+    stopped = (stop_column < N_MINUTES) & (stop_column <= target_column)
+    targeted = (target_column < N_MINUTES) & ~stopped
+    exit_column = np.select([stopped, targeted], [stop_column, target_column], np.maximum(time_column, 0))
+    exit_open = open_[rows, np.minimum(exit_column, N_MINUTES - 1)]
+    exit_price = np.select([stopped, targeted],
+                           [np.fmin(stop_price, exit_open), np.fmax(target_price, exit_open)],
+                           close[rows, exit_column])
+    return {'entered': entered, 'entry_column': entry_column, 'entry_price': entry_price,
+            'exit_column': exit_column, 'exit_price': exit_price,
+            'exit_reason': np.select([stopped, targeted], ['stop', 'target'], 'time'),
+            'return': np.where(entered, exit_price / entry_price - 1, np.nan)}
+
+def grid_time(columns, dates):
+    ''' Wall-clock Timestamps of grid columns on the given days '''
+    return pd.to_datetime(dates) + pd.to_timedelta(MARKET_OPEN + columns, unit='m')
+
+def trade_frame(panel, result):
+    ''' One row per trade of a simulate() result '''
+    entered = result['entered']
+    days = panel.days.loc[entered, ['ticker', 'date']].reset_index(drop=True)
+    return days.assign(
+        entry_time=grid_time(result['entry_column'][entered], days['date']),
+        entry_price=result['entry_price'][entered],
+        exit_time=grid_time(result['exit_column'][entered], days['date']),
+        exit_price=result['exit_price'][entered],
+        exit_reason=result['exit_reason'][entered],
+        **{'return': result['return'][entered]})
+
+def summarize(result):
+    ''' Trade count, win rate, average / total return, profit factor and max drawdown of
+    the summed returns, trades in panel (date) order '''
+    returns = result['return'][result['entered']]
+    if len(returns) == 0:
+        return {'trades': 0, 'win_rate': np.nan, 'avg_return': np.nan, 'total_return': 0.0,
+                'profit_factor': np.nan, 'max_drawdown': 0.0}
+    gains, losses = returns[returns > 0].sum(), -returns[returns < 0].sum()
+    equity = np.cumsum(returns)
+    return {'trades': len(returns), 'win_rate': float((returns > 0).mean()), 'avg_return': float(returns.mean()),
+            'total_return': float(equity[-1]), 'profit_factor': float(gains / losses) if losses else np.inf,
+            'max_drawdown': float((np.maximum.accumulate(np.maximum(equity, 0)) - equity).max())}
+
+def parameter_grid(grid):
+    ''' Every combination of a {parameter: [values]} grid, over DEFAULT_PARAMS '''
+    names = list(grid)
+    return [{**DEFAULT_PARAMS, **dict(zip(names, values))} for values in itertools.product(*grid.values())]
+
+# Memory-mapped Panel of a sweep worker process, loaded once by sweep_worker_init
+_worker = {}
+
+def sweep_worker_init(path):
+    _worker['panel'] = Panel.load(path, mmap=True)
+
+def run_parameters(chunk):
+    panel = _worker['panel']
+    return [{**params, **summarize(simulate(panel, **params))} for params in chunk]
+
+@instrument.timed('backtest_sweep')
+def sweep(panel, grid, workers=None, chunk_size=4):
+    ''' Summaries of every combination of grid on a Panel (or the path of a saved one),
+    sorted by total return. Combinations are spread over worker processes that memory-map
+    the panel; workers=1 runs in this process '''
+    combinations = parameter_grid(grid)
+    if workers == 1:
+        panel = Panel.load(panel) if isinstance(panel, str) else panel
+        rows = [{**params, **summarize(simulate(panel, **params))} for params in combinations]
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = panel if isinstance(panel, str) else tmp
+            if not isinstance(panel, str):
+                panel.save(path)
+            chunks = [combinations[i:i + chunk_size] for i in range(0, len(combinations), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=sweep_worker_init, initargs=(path,)) as executor:
+                rows = [row for chunk in executor.map(run_parameters, chunks) for row in chunk]
+    return pd.DataFrame(rows).sort_values('total_return', ascending=False, ignore_index=True)
+
+def add_arguments(parser):
+    parser.add_argument('--start', help='first day, YYYY-MM-DD')
+    parser.add_argument('--end', help='last day, YYYY-MM-DD')
+    parser.add_argument('--ticker', nargs='+', type=str.upper, help='only these tickers')
+    parser.add_argument('--panel', help='read a panel saved with --save-panel instead of Postgres')
+    parser.add_argument('--dataset', action='store_true', help='read the Parquet mirror (dataset sync) instead of Postgres')
+    parser.add_argument('--save-panel', help='save the loaded panel to this directory')
+    parser.add_argument('--range-minutes', type=int, nargs='+', default=[5], help='opening range length')
+    parser.add_argument('--entry-buffer', type=float, nargs='+', default=[0.0],
+                        help='entry this fraction above the range high')
+    parser.add_argument('--stop', type=float, nargs='+', default=[0.05], help='stop fraction below the entry, 0 for none')
+    parser.add_argument('--target', type=float, nargs='+', default=[0.0], help='target fraction above the entry, 0 for none')
+    parser.add_argument('--latest-entry', nargs='+', default=['16:00'], help='no entries after this HH:MM')
+    parser.add_argument('--exit-time', nargs='+', default=['15:59'], help='close the trade on this HH:MM candle')
+    parser.add_argument('--min-gap', type=float, nargs='+', help='only days with a gap of at least this')
+    parser.add_argument('--workers', type=int, help='processes, one per CPU by default')
+    parser.add_argument('--top', type=int, default=20, help='combinations to print')
+    parser.add_argument('--output', help='write every combination to this csv')
+    parser.add_argument('--trades', help='write the trades of the best combination to this csv')
+
+def run(args):
+    if args.panel:
+        panel = Panel.load(args.panel)
+    elif args.dataset:
+        panel = load_dataset_panel(args.start, args.end, args.ticker)
+    else:
+        from . import store
+        panel = load_panel(store.engine_from_config(), args.start, args.end, args.ticker)
+    print(colored(f'{len(panel)} ticker-days loaded', 'cyan'))
+    if args.save_panel:
+        panel.save(args.save_panel)
+    grid = {'range_minutes': args.range_minutes, 'entry_buffer': args.entry_buffer, 'stop': args.stop,
+            'target': args.target, 'latest_entry': args.latest_entry, 'exit_time': args.exit_time}
+    if args.min_gap:
+        grid['min_gap'] = args.min_gap
+    results = sweep(args.panel or panel, grid, workers=args.workers)
+    print(results.head(args.top).to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f'{len(results)} combinations written to {args.output}')
+    if args.trades:
+        best = {name: None if pd.isna(value) else value for name, value in results.iloc[0][list(DEFAULT_PARAMS)].items()}
+        trades = trade_frame(panel, simulate(panel, **best))
+        trades.to_csv(args.trades, index=False)
+        print(f'{len(trades)} trades of the best combination written to {args.trades}')
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backtest the 5mins high breakout over the stored 1min bars')
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# File system and thread-safe writes
+import os
+import threading
+import time
+
+# Data analysis and manipulation
+import pandas as pd
+
+from . import bars, config
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'data_collection', 'aggs')
+
+class AggregateCache:
+    ''' On-disk Parquet cache of raw Polygon aggregate results, one file per
+    symbol/timespan/date range: {cache_dir}/{symbol}/{timespan}/{start}_{end}.parquet
+
+    A file's mtime is the time it was fetched. A range fetched after its last session
+    had settled (the end of the extended session plus settle seconds for Polygon to
+    finalize the bars) never expires. Any other file, e.g. one written during the session,
+    expires after ttl seconds, also once the day is over. Entries put with final=False
+    ({start}_{end}.ttl.parquet) always expire after ttl seconds.
+    Reads stamp the file's atime, and when the cache grows past max_bytes the
+    least recently used files are deleted. '''
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 1024 ** 3, ttl=60, settle=3600, clock=time.time):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.settle = settle
+        self.clock = clock
+        self.lock = threading.Lock()
+        # Running size estimate, so the directory is only scanned when eviction may be needed
+        self.size = None
+
+    def path(self, symbol, timespan, start_date, end_date, final=True):
+        name = f'{start_date}_{end_date}' if final else f'{start_date}_{end_date}.ttl'
+        return os.path.join(self.cache_dir, symbol.upper(), timespan, f'{name}.parquet')
+
+    def settled_at(self, end_date):
+        ''' Epoch seconds from which the bars of a range ending on end_date no longer change '''
+        day = pd.Timestamp(end_date).normalize()
+        if day.tz is None:
+            day = day.tz_localize(bars.EASTERN)
+        return (day + bars.SESSION_END).timestamp() + self.settle
+
+    def is_immutable(self, end_date, fetched):
+        ''' True if the range was fetched (epoch seconds) after its last session settled '''
+        return fetched >= self.settled_at(end_date)
+
+    def get(self, symbol, timespan, start_date, end_date):
+        ''' Cached results as a DataFrame, or None on a miss or an expired entry '''
+        for final in (True, False):
+            path = self.path(symbol, timespan, start_date, end_date, final)
+            try:
+                fetched = os.path.getmtime(path)
+            except OSError:
+                continue
+            if not (final and self.is_immutable(end_date, fetched)) and self.clock() - fetched > self.ttl:
+                continue
+            try:
+                results = pd.read_parquet(path)
+            except Exception:
+                # A corrupt or partially written file is treated as a miss
+                continue
+            # Mark as recently used for the LRU eviction, the mtime keeps the fetch time
+            os.utime(path, (self.clock(), fetched))
+            return results
+        return None
+
+    def put(self, symbol, timespan, start_date, end_date, results, final=True):
+        ''' Store a DataFrame of raw results, then evict if over the size cap. With
+        final=False the entry expires after ttl seconds even once its session settled '''
+        path = self.path(symbol, timespan, start_date, end_date, final)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        results.to_parquet(tmp_path, index=False)
+        now = self.clock()
+        os.utime(tmp_path, (now, now))
+        written = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if self.size is not None:
+                self.size += written
+        if self.size is None or self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        ''' Delete least recently used files until the cache fits in max_bytes '''
+        with self.lock:
+            files = []
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    if name.endswith('.parquet'):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self.size = total
+
+def cache_from_config():
+    ''' Build the cache from the CACHE_* settings of sql_config, None if CACHE_DIR is set to None '''
+    cache_dir = config.get('CACHE_DIR', DEFAULT_CACHE_DIR)
+    if cache_dir is None:
+        return None
+    return AggregateCache(cache_dir,
+                          max_bytes=int(config.get('CACHE_MAX_MB', 2048) * 1024 ** 2),
+                          ttl=config.get('CACHE_TTL_SECONDS', 60),
+                          settle=config.get('CACHE_SETTLE_SECONDS', 3600))
@@ -0,0 +1,79 @@
+''' Canonical bar schema shared by the fetch, metric, plot and store steps.
+
+Every OHLCV frame has a 'Date' column of datetime64[ns, US/Eastern] and compact
+numeric columns: float32 prices, int64 volume and int32 trade counts. Dates stay
+datetimes from the API to the database, they are never formatted to strings and
+parsed back. '''
+
+# Data analysis and manipulation
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr,
+                                    USMemorialDay, USPresidentsDay, USThanksgivingDay, nearest_workday,
+                                    sunday_to_monday)
+
+EASTERN = 'US/Eastern'
+
+BAR_DTYPES = {'Open':'float32', 'High':'float32', 'Low':'float32', 'Close':'float32',
+              'Volume':'int64', 'Vwap':'float32', 'N_of_trades':'int32'}
+
+# The extended session ends with the 19:59 bar
+SESSION_END = pd.Timedelta(hours=20)
+
+class MarketHolidayCalendar(AbstractHolidayCalendar):
+    ''' Full-day NYSE holidays. New Year's Day on a Saturday is not observed on the Friday before '''
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+# Unscheduled full-day closures
+SPECIAL_CLOSURES = {'2012-10-29', '2012-10-30', '2018-12-05', '2025-01-09'}
+
+_holidays = MarketHolidayCalendar()
+
+def is_trading_day(date):
+    ''' False on weekends, NYSE holidays and unscheduled closures '''
+    day = pd.Timestamp(date).normalize()
+    if day.dayofweek >= 5 or day.strftime('%Y-%m-%d') in SPECIAL_CLOSURES:
+        return False
+    return len(_holidays.holidays(day, day)) == 0
+
+# Polygon prices have at most 4 decimals, float32 prices are rounded back to them
+PRICE_DECIMALS = 4
+
+def to_bar_schema(df):
+    ''' Downcast an OHLCV frame to BAR_DTYPES with an Eastern tz-aware 'Date' column '''
+    dates = pd.to_datetime(df['Date'])
+    if dates.dt.tz is None:
+        dates = dates.dt.tz_localize(EASTERN)
+    df = df.assign(Date=dates.dt.tz_convert(EASTERN))
+    for column, dtype in BAR_DTYPES.items():
+        if column not in df.columns:
+            continue
+        if dtype.startswith('int'):
+            # Polygon may omit trade counts or send adjusted fractional volume
+            values = df[column].round()
+            df[column] = values.astype(dtype) if values.notna().all() else values.astype(dtype.capitalize())
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def wall_clock(dates):
+    ''' Eastern tz-aware dates as tz-naive Eastern wall-clock time, as stored in
+    one_min_data and shown on the charts '''
+    if isinstance(dates, pd.DatetimeIndex):
+        return dates.tz_convert(EASTERN).tz_localize(None) if dates.tz is not None else dates
+    dates = pd.Series(dates)
+    return dates.dt.tz_convert(EASTERN).dt.tz_localize(None) if dates.dt.tz is not None else dates
+
+def price(value):
+    ''' A float32 price as a Python float without the float32 noise (9.399999618 -> 9.4) '''
+    return round(float(value), PRICE_DECIMALS)
@@ -0,0 +1,543 @@
+''' Command line entry point: python -m data_collection <command>
+
+menu      the interactive data entering bot (the default)
+ingest    download, compute and store one ticker-day
+plot      chart a ticker-day (or a range of days) from the database, or else from the API
+export    render the charts of many ticker-days to html / png files in parallel
+minutes   stream months of 1min bars of a ticker into one_min_data
+live      follow a ticker through the current session, see live.py
+gappers   gap-up candidates of a date from the grouped daily bars of the whole market
+scan      breakout metrics of every stored ticker-day computed in Postgres, see scanner.py
+backfill  many ticker-days from a csv, see backfill.py
+dataset   local Parquet mirror of the database for research reads, see dataset.py
+backtest  sweep breakout entry / exit rules over the stored 1min bars, see backtest.py
+reference local ticker reference data, see reference_data.py
+
+Modules are imported by the command that needs them, so a headless run does not
+pay for plotly, selenium or IPython. The commands defined by their own module
+(MODULE_COMMANDS) only import it to build their arguments when they are the one run.
+
+Every command takes --log-json (a json line per pipeline stage), --metrics-file /
+--metrics-port (Prometheus text) and --profile (cProfile stats), see instrument.py. '''
+
+import argparse
+import importlib
+import sys
+
+from termcolor import colored
+
+from . import instrument
+
+TIMEFRAMES = ['1min', '5min', '15min', '30min', '1h']
+
+# store.ON_CONFLICT, without importing sqlalchemy to build the parser
+ON_CONFLICT = ('skip', 'overwrite')
+
+# Commands whose arguments and handler are add_arguments / run of their module
+MODULE_COMMANDS = {
+    'backfill': ('backfill', 'many ticker-days from a csv without prompts'),
+    'dataset': ('dataset', 'local Parquet mirror of the database'),
+    'backtest': ('backtest', 'sweep breakout rules over the stored 1min bars'),
+    'scan': ('scanner', 'breakout metrics of the stored 1min bars, in Postgres'),
+    'reference': ('reference_data', 'local ticker reference data'),
+}
+
+def validated_input_plot(prompt, input_value):
+    """ A function to receive user input and validate that it matches the acceptable inputs
+    """
+    # flag to track if input is valid or not
+    valid_input = False
+    # loop until a valid input is received
+    while not valid_input:
+        value = input(prompt + ' (' + '/'.join(input_value) + '): ')
+        # check if input is in the list of accepted inputs
+        valid_input = value.lower() in input_value
+        # if input is 'q', break the loop and return
+        if value.lower() in ['q','n']:
+            break
+    # return the received input
+    return value
+
+@instrument.timed('sector_selenium')
+def nasdaq_sector(ticker):
+    ''' Scrape the sector from nasdaq.com with Selenium, last resort of option 1 '''
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # The path for chromedriver
+    web_driver_path = r'C:\Users\admin\Python\Web Scrape Related\chromedriver.exe'
+    selenium_driver = webdriver.Chrome(web_driver_path)
+
+    # The website we need to access
+    selenium_driver.get(f'https://www.nasdaq.com/market-activity/stocks/{ticker}')
+
+    # wait for the "Accept Cookies" button to appear
+    selenium_wait = WebDriverWait(selenium_driver, 10)
+    accept_cookies_button = selenium_wait.until(EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler")))
+
+    # click on the "Accept Cookies" button
+    accept_cookies_button.click()
+
+    # Find the element using XPATH
+    sector_element = selenium_driver.find_element(By.XPATH, '//td[text()="Sector"]/following-sibling::td')
+    final_sector = sector_element.text
+    selenium_driver.quit()
+    return final_sector
+
+def display_frame(df):
+    ''' Rich display in a notebook, plain print in a terminal '''
+    try:
+        from IPython.display import display
+    except ImportError:
+        print(df.to_string())
+    else:
+        display(df)
+
+def plot_loop(bar_pyramids, ticker, ending_date, df_plot, prompt, choices):
+    ''' Ask for timeframes and chart them until the user quits '''
+    from .plot import plotly_1min_chart, timeframe_plot
+
+    while True:
+        # Input for time frame
+        Questioning_tframe = validated_input_plot(prompt, choices)
+        # Set time frame for 1 minute
+        if Questioning_tframe.lower() == '1min':
+            plotly_1min_chart(df_plot,Questioning_tframe,ticker,ending_date)
+        elif Questioning_tframe.lower() in ['5min','15min','30min','1h']:
+            # Every timeframe of the ticker-day is resampled once, then served from the in-session cache
+            timeframe_plot(bar_pyramids.levels(ticker, ending_date, df_plot),Questioning_tframe,ticker,ending_date)
+        else:
+            break
+
+def enter_ticker_data(cnx, client, bar_pyramids):
+    ''' Option 1: download stock data and update it to SQL: daily +0 and -1, exchange traded on and sector data '''
+    import pandas as pd
+    from . import reference_data, store
+    from .fetch import breakout_inputs, daily_inputs
+    from .polygon_client import exchange_name
+
+    # Get ticker name from user input
+    ticker = input('Ticker name : ').upper()
+
+    # Starting date will be day -1
+    starting_date = input('Starting date is  : ')
+    # Ending date will be day +0
+    ending_date = input('Ending date is : ')
+
+    # Get intraday data
+    df_plot = client.aggregates(ticker, 'minute', ending_date, ending_date)
+
+    try:
+        # Get intraday volume before breakout time, 5 minute high and high of the day
+        day_metrics = breakout_inputs(df_plot, ticker, ending_date)
+        # Getting day-1 and day+0 daily chart price data
+        daily = daily_inputs(client, ticker, starting_date, ending_date)
+    except ValueError as e:
+        print(colored(str(e), 'red'))
+        return
+
+    # Data required from day -1
+    Prev_Close = daily['prev_close']
+    Prior_day_vol = daily['prior_day_vol']
+    Prior_day_VWAP = daily['prior_day_vwap']
+
+    # Weekday of day 0
+    weekday = daily['weekday']
+
+    # Data required from day 0
+    Open_today = daily['open']
+    High_today = daily['high']
+    Low_today = daily['low']
+    Close_today = daily['close']
+    volume_today = daily['dv']
+
+    # Get exchange and weighted shares outstanding
+    exchange = None
+    weighted_shares_oustanding = None
+    try:
+        # Stock details from the local reference store, or else from the API
+        results = reference_data.ticker_details(cnx, client, ticker, ending_date)
+        weighted_shares_oustanding = results.get('weighted_shares_outstanding')
+
+        # If both data types is correct then rename Exchange name, else it might be an error
+        if isinstance(results.get('weighted_shares_outstanding'),int) and isinstance(results.get('primary_exchange'),str)==True:
+            exchange = exchange_name(results.get('primary_exchange'))
+        else:
+            print('-----------------------------------------------\nExchange may belongs to OTC, trying next method\n-----------------------------------------------')
+            try:
+                weighted_shares_oustanding = int(input('Polygon.io API can\'t find shares_outstanding, please fill out manually '))
+                exchange = results.get('market')
+            except Exception as e:
+                print('error occurred at getting exchange and shares outstanding ', e)
+    except Exception as e:
+        print('error occurred at getting exchange and shares outstanding ', e)
+
+    result_sum_loc = day_metrics['vol_b4_bo']
+    five_mins_high = day_metrics['five_mins_high']
+    HOD_final = day_metrics['hod']
+
+    # Sector from the local reference store, or else scraped from yahoo
+    try:
+        final_sector = reference_data.sector(cnx, client, ticker)
+    except Exception as e:
+        print('-----------------------------------------------\nwebscraping sector info failed, try next method\n-----------------------------------------------')
+        final_sector = nasdaq_sector(ticker)
+        reference_data.save_sector(cnx, ticker, final_sector)
+
+    # Store all infos to a dictionary
+    dic_1 = {
+        'weekday':f'{weekday}',
+        'date': f'{ending_date}',
+        'ticker': f'{ticker}',
+        'exchange': f'{exchange}',
+        'industry': f'{final_sector}',
+        'so': int(f'{weighted_shares_oustanding}'),
+        'dv': int(f'{volume_today}'),
+        'prior_day_vol': int(f'{Prior_day_vol}'),
+        'prior_day_vwap': float(f'{Prior_day_VWAP}'),
+        'b_run_up_low': float(input('B runup low is : ')),
+        'run_up_high': float(input('Run up High is ')),
+        'prev_close': float(f'{Prev_Close}'),
+        'open': float(f'{Open_today}'),
+        'low': float(f'{Low_today}'),
+        'five_mins_high': float(f'{five_mins_high}'),
+        'high': float(f'{High_today}'),
+        'close': float(f'{Close_today}'),
+        'vol_b4_bo': int(f'{result_sum_loc}'),
+        'hod': f'{HOD_final}'
+    }
+
+    # Convert dictionary to dataframe
+    df = pd.DataFrame.from_dict([dic_1])
+
+    # If date and ticker from new data is duplicated in the table
+    if store.is_stored(cnx, ticker, ending_date):
+        print('\nDuplicated data !!!!')
+        return
+
+    display_frame(df)
+    print(colored('-------------------------','red',attrs=['bold']))
+
+    # Get input on whether to plot chart or not
+    Questioning_input_plot = validated_input_plot('Do you want to plot the chart? ',['y','n '])
+    if Questioning_input_plot.lower() == 'y':
+        plot_loop(bar_pyramids, ticker, ending_date, df_plot,
+                  'Select a time frame, for exit press q', ['1min','5min','15min','30min','1h '])
+
+    # Ask the user if they want to update the data
+    Questioning_input = str(input('Do you want to update the data? y/n '))
+
+    if Questioning_input.lower() == 'y':
+        # Store data to SQL tables "primary_sheet", "one_min_data" and the 5min to 1h tables
+        store.store_ticker_day(cnx, df, df_plot, ticker,
+                               levels=bar_pyramids.levels(ticker, ending_date, df_plot))
+        print(colored('Data has been stored', 'red', attrs=['underline']))
+        print()
+    else:
+        print('\n')
+        print(colored('Data has not been stored', attrs=['underline']))
+
+def plot_ticker_data(cnx, client, bar_pyramids):
+    ''' Option 2: display intraday(1min) with volume interactive chart '''
+    from . import store
+
+    ticker = input('Ticker name : ').upper()
+
+    # Ending date will be day +0
+    ending_date = input('Ending date is : ')
+    # Stored days are charted from the database, others from the intraday +0 data
+    levels = bar_pyramids.get(ticker, ending_date) or store.read_pyramid(cnx, ticker, ending_date)
+    if levels is not None:
+        bar_pyramids.put(ticker, ending_date, levels)
+        df_plot = levels['1min']
+    else:
+        df_plot = client.aggregates(ticker, 'minute', ending_date, ending_date)
+
+    # Visual separator
+    print(colored('-------------------------','red',attrs=['bold']))
+    plot_loop(bar_pyramids, ticker, ending_date, df_plot,
+              'Select a frame or press q to quit', ['1min','5min','15min','30min','1h',' '])
+
+def menu(args):
+    ''' Start the bot
+    Option 1 will download stock data and update it to SQL: daily +0 and -1, exchange traded on and sector data
+    Option 2 will display intraday(1min) with volume interactive chart
+    Option 3 will exit the bot '''
+    from . import pyramid, store
+    from .fetch import client_from_config
+
+    # Setup python connection with SQL
+    cnx = store.engine_from_config()
+    client = client_from_config()
+
+    # For plotting different timeframe chart, keeps every timeframe of recent ticker-days
+    bar_pyramids = pyramid.PyramidCache()
+
+    while True:
+        print('-----------------------------------------')
+        print('Welcome to Beast\'s Data Entering Algo')
+        print(colored('1. Entering new ticker data to SQL','cyan'))
+        print(colored('2. Only plot the chart','blue'))
+        print(colored('3. Exit',attrs=['bold']))
+        print()
+
+        option = int(input('Choose an option\n'))
+        print()
+
+        # Option 1: Enter new ticker data to SQL
+        if option == 1:
+            enter_ticker_data(cnx, client, bar_pyramids)
+            if args.metrics_file:
+                instrument.write_prometheus(args.metrics_file)
+        # Option 2 for data visualization
+        elif option == 2:
+            plot_ticker_data(cnx, client, bar_pyramids)
+        # Exit option
+        elif option == 3:
+            print('Thanks for using Beast\'s Data Entering Algo')
+            return 0
+
+def ingest(args):
+    ''' Store one ticker-day without prompts. OTC tickers without shares outstanding fail and go through the menu '''
+    import pandas as pd
+    from . import store
+    from .fetch import client_from_config, fetch_ticker_day
+
+    client = client_from_config(calls_per_minute=args.calls_per_minute)
+    cnx = None if args.dry_run else store.engine_from_config()
+    if cnx is not None and args.on_conflict == 'skip' and store.is_stored(cnx, args.ticker, args.end):
+        print(colored(f'{args.ticker} {args.end} is already stored', 'red'))
+        return 0
+
+    try:
+        row, df_plot = fetch_ticker_day(client, args.ticker, args.start, args.end, cnx,
+                                        args.b_run_up_low, args.run_up_high)
+    except ValueError as e:
+        print(colored(f'{args.ticker} {args.end}: {e}', 'red'))
+        return 1
+
+    df = pd.DataFrame([row])
+    print(df.to_string(index=False))
+    if cnx is not None:
+        store.store_ticker_day(cnx, df, df_plot, args.ticker, on_conflict=args.on_conflict)
+        print(colored('Data has been stored', 'red', attrs=['underline']))
+    return 0
+
+def plot(args):
+    ''' Chart a ticker-day, from the database when it is stored, else from the API.
+    With --through the 1min bars of every day up to it are downloaded and charted together '''
+    from . import pyramid, store
+    from .fetch import client_from_config
+    from .plot import timeframe_plot
+
+    levels = None
+    if not args.no_db and args.through is None:
+        levels = store.read_pyramid(store.engine_from_config(), args.ticker, args.date)
+    if levels is None:
+        df_plot = client_from_config().aggregates(args.ticker, 'minute', args.date, args.through or args.date)
+        levels = pyramid.build_pyramid(df_plot)
+    title_date = f'{args.date} - {args.through}' if args.through else args.date
+    timeframe_plot(levels, args.timeframe, args.ticker, title_date, args.output,
+                   args.window_start, args.window_end, args.max_bars)
+    if args.output:
+        print(f'Chart written to {args.output}')
+    return 0
+
+def export(args):
+    ''' Render the charts of the ticker-days of a csv in worker processes '''
+    import pandas as pd
+    from .plot import export_charts
+
+    jobs = pd.read_csv(args.jobs, dtype=str)
+    date_column = 'date' if 'date' in jobs.columns else 'end_date'
+    ticker_days = list(zip(jobs['ticker'].str.strip().str.upper(), jobs[date_column]))
+    written, failed = export_charts(ticker_days, args.output_dir, args.timeframe, args.format,
+                                    workers=args.workers, use_db=not args.no_db)
+    for (ticker, date), error in failed.items():
+        print(colored(f'{ticker} {date} failed: {error}', 'red'))
+    print(colored(f'{len(written)} of {len(ticker_days)} charts written to {args.output_dir}', 'cyan'))
+    return 1 if failed else 0
+
+def minutes(args):
+    ''' Stream the 1min bars of a date range into one_min_data, one Polygon page at a time '''
+    from . import store
+    from .fetch import client_from_config
+
+    client = client_from_config(calls_per_minute=args.calls_per_minute)
+    frames = client.stream_aggregates(args.ticker, 'minute', args.start, args.end, limit=args.limit)
+    rows = store.stream_one_min_data(store.engine_from_config(), args.ticker, frames, args.start, args.end)
+    print(colored(f'{rows} 1min bars of {args.ticker} stored from {args.start} to {args.end}', 'cyan'))
+    return 0
+
+def live(args):
+    ''' Follow a ticker bar by bar: poll Polygon for the session of --date (today by default),
+    or with --replay play a finished day back. Replays are not stored '''
+    import pandas as pd
+    from . import bars, store
+    from .fetch import client_from_config
+    from .live import LiveChart, LiveSession, PollingSource, ReplaySource
+
+    day = args.date or pd.Timestamp.now(tz=bars.EASTERN).strftime('%Y-%m-%d')
+    client = client_from_config(calls_per_minute=args.calls_per_minute)
+    cnx = None if args.no_db else store.engine_from_config()
+    chart = LiveChart(args.ticker, day, args.output, refresh=args.interval) if args.output else None
+
+    def on_breakout(session):
+        print(colored(f'{args.ticker} broke out at {session.state.breakout:%H:%M} above '
+                      f'{session.state.five_mins_high:.4f}, volume before breakout {session.state.vol_b4_bo}',
+                      'green', attrs=['bold']))
+
+    if args.replay:
+        levels = store.read_pyramid(cnx, args.ticker, day) if cnx is not None else None
+        frame = levels['1min'] if levels is not None else client.aggregates(args.ticker, 'minute', day, day)
+        session = LiveSession(args.ticker, day, chart=chart, on_breakout=on_breakout)
+        source = ReplaySource(frame, batch=args.batch_size, speed=args.speed)
+    else:
+        session = LiveSession(args.ticker, day, cnx, chart, args.batch_size, on_breakout)
+        since = session.resume()
+        source = PollingSource(client, args.ticker, day, args.interval, since)
+
+    try:
+        metrics = session.run(source)
+    except KeyboardInterrupt:
+        metrics = session.state.metrics()
+    print(colored(f'{args.ticker} {day}: 5mins high {metrics["five_mins_high"]}, HOD {metrics["hod"]}, '
+                  f'breakout {metrics["breakout"]}, volume before breakout {metrics["vol_b4_bo"]}', 'cyan'))
+    return 0
+
+def gappers(args):
+    ''' Gap-up candidates of a date from two grouped daily requests. The csv written to
+    --output has ticker,start_date,end_date columns, so it can be used as backfill jobs '''
+    from .fetch import client_from_config
+    from .grouped_daily import gappers as find_gappers
+
+    client = client_from_config(calls_per_minute=args.calls_per_minute)
+    candidates = find_gappers(client, args.date, args.previous, min_gap=args.min_gap,
+                              min_prior_dollar_vol=args.min_dollar_vol, min_open=args.min_open)
+    print(candidates.head(args.top).to_string())
+    if args.output:
+        candidates.to_csv(args.output)
+        print(f'{len(candidates)} candidates written to {args.output}')
+    return 0
+
+def build_parser(command=None):
+    ''' The argument parser. Of the MODULE_COMMANDS only command gets its arguments, the
+    others are listed with their help '''
+    parser = argparse.ArgumentParser(prog='python -m data_collection',
+                                     description='Beast\'s Data Entering Algo')
+    parser.add_argument('--log-json', action='store_true', help='log every pipeline stage as a json line')
+    parser.add_argument('--metrics-file', help='write Prometheus text metrics to this file when done')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus text metrics on this port')
+    parser.add_argument('--profile', help='run under cProfile and save the stats to this file')
+    subparsers = parser.add_subparsers(dest='command')
+
+    menu_parser = subparsers.add_parser('menu', help='interactive bot (default)')
+    menu_parser.set_defaults(func=menu)
+
+    ingest_parser = subparsers.add_parser('ingest', help='download, compute and store one ticker-day')
+    ingest_parser.add_argument('ticker', type=str.upper)
+    ingest_parser.add_argument('--start', required=True, help='day -1, YYYY-MM-DD')
+    ingest_parser.add_argument('--end', required=True, help='day +0, YYYY-MM-DD')
+    ingest_parser.add_argument('--b-run-up-low', type=float, help='B runup low, required unless --dry-run')
+    ingest_parser.add_argument('--run-up-high', type=float, help='Run up High, required unless --dry-run')
+    ingest_parser.add_argument('--calls-per-minute', type=float,
+                               help='Polygon rate limit, defaults to POLYGON_CALLS_PER_MINUTE in sql_config')
+    ingest_parser.add_argument('--on-conflict', choices=ON_CONFLICT, default='skip',
+                               help='skip the ticker-day when already in primary_sheet or overwrite it')
+    ingest_parser.add_argument('--dry-run', action='store_true', help='only print the computed row')
+    ingest_parser.set_defaults(func=ingest)
+
+    plot_parser = subparsers.add_parser('plot', help='chart a ticker-day')
+    plot_parser.add_argument('ticker', type=str.upper)
+    plot_parser.add_argument('date', help='YYYY-MM-DD')
+    plot_parser.add_argument('--timeframe', choices=TIMEFRAMES, default='1min')
+    plot_parser.add_argument('--output', help='write the chart to a .html (or image) file instead of showing it')
+    plot_parser.add_argument('--no-db', action='store_true', help='always download the bars from the API')
+    plot_parser.add_argument('--through', help='last day of a multi-day chart, YYYY-MM-DD')
+    plot_parser.add_argument('--window-start', help='only chart bars from this time on, e.g. "2023-03-03 09:30"')
+    plot_parser.add_argument('--window-end', help='only chart bars up to this time')
+    plot_parser.add_argument('--max-bars', type=int, default=1500, help='downsample to about this many candles')
+    plot_parser.set_defaults(func=plot)
+
+    export_parser = subparsers.add_parser('export', help='render charts of many ticker-days to files')
+    export_parser.add_argument('jobs', help='csv with ticker and date (or end_date) columns')
+    export_parser.add_argument('--output-dir', default='charts')
+    export_parser.add_argument('--timeframe', choices=TIMEFRAMES, default='1min')
+    export_parser.add_argument('--format', choices=['html', 'png', 'svg', 'pdf'], default='html',
+                               help='images need the kaleido package')
+    export_parser.add_argument('--workers', type=int, help='worker processes, one per CPU by default')
+    export_parser.add_argument('--no-db', action='store_true', help='always download the bars from the API')
+    export_parser.set_defaults(func=export)
+
+    minutes_parser = subparsers.add_parser('minutes', help='stream 1min bars of a date range into one_min_data')
+    minutes_parser.add_argument('ticker', type=str.upper)
+    minutes_parser.add_argument('--start', required=True, help='first day, YYYY-MM-DD')
+    minutes_parser.add_argument('--end', required=True, help='last day, YYYY-MM-DD')
+    minutes_parser.add_argument('--limit', type=int, default=50000, help='bars per Polygon page (max 50000)')
+    minutes_parser.add_argument('--calls-per-minute', type=float,
+                                help='Polygon rate limit, defaults to POLYGON_CALLS_PER_MINUTE in sql_config')
+    minutes_parser.set_defaults(func=minutes)
+
+    live_parser = subparsers.add_parser('live', help='follow a ticker through the current session')
+    live_parser.add_argument('ticker', type=str.upper)
+    live_parser.add_argument('--date', help='session to follow, YYYY-MM-DD, today by default')
+    live_parser.add_argument('--interval', type=float, default=5.0, help='seconds between polls')
+    live_parser.add_argument('--batch-size', type=int, default=5, help='bars per one_min_data write')
+    live_parser.add_argument('--output', help='keep a self-reloading html chart up to date in this file')
+    live_parser.add_argument('--replay', action='store_true', help='play a finished day back instead of polling')
+    live_parser.add_argument('--speed', type=float, help='replay speed-up over real time, as fast as possible by default')
+    live_parser.add_argument('--no-db', action='store_true', help='do not store the bars')
+    live_parser.add_argument('--calls-per-minute', type=float,
+                             help='Polygon rate limit, defaults to POLYGON_CALLS_PER_MINUTE in sql_config')
+    live_parser.set_defaults(func=live)
+
+    gappers_parser = subparsers.add_parser('gappers', help='gap-up candidates of a date across the market')
+    gappers_parser.add_argument('date', help='day +0, YYYY-MM-DD')
+    gappers_parser.add_argument('--previous', help='day -1, defaults to the previous session')
+    gappers_parser.add_argument('--min-gap', type=float, default=0.0, help='minimum (open - prev_close) / prev_close')
+    gappers_parser.add_argument('--min-dollar-vol', type=float, default=0, help='minimum prior day dollar volume')
+    gappers_parser.add_argument('--min-open', type=float, default=0.0, help='minimum open price')
+    gappers_parser.add_argument('--top', type=int, default=50, help='candidates to print')
+    gappers_parser.add_argument('--output', help='write every candidate to this csv')
+    gappers_parser.add_argument('--calls-per-minute', type=float,
+                                help='Polygon rate limit, defaults to POLYGON_CALLS_PER_MINUTE in sql_config')
+    gappers_parser.set_defaults(func=gappers)
+
+    for name, (module_name, help) in MODULE_COMMANDS.items():
+        if name != command:
+            # Placeholder, without -h so that `<name> --help` reaches the full parser
+            subparsers.add_parser(name, help=help, add_help=False)
+            continue
+        module = importlib.import_module(f'.{module_name}', __package__)
+        module_parser = subparsers.add_parser(name, help=help)
+        module.add_arguments(module_parser)
+        module_parser.set_defaults(func=module.run)
+    return parser
+
+def main(argv=None):
+    # The command is found first, so only its module is imported for the full parse
+    command, _ = build_parser().parse_known_args(argv)
+    parser = build_parser(command.command) if command.command in MODULE_COMMANDS else build_parser()
+    args = parser.parse_args(argv)
+    # primary_sheet needs the run-up columns, checked before any request is made
+    if args.command == 'ingest' and not args.dry_run and (args.b_run_up_low is None or args.run_up_high is None):
+        parser.error('ingest needs --b-run-up-low and --run-up-high unless --dry-run is set')
+    command = args.func if args.command is not None else menu
+    if args.log_json:
+        instrument.log_json()
+    if args.metrics_port:
+        instrument.serve_prometheus(args.metrics_port)
+    try:
+        if args.profile:
+            with instrument.profile(args.profile):
+                return command(args)
+        return command(args)
+    finally:
+        instrument.log_event('run', command=args.command or 'menu', **instrument.registry.snapshot())
+        if args.metrics_file:
+            instrument.write_prometheus(args.metrics_file)
+
+if __name__ == '__main__':
+    sys.exit(main())
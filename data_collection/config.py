@@ -0,0 +1,10 @@
+''' Settings from sql_config.py, imported on first use so that importing the package
+does not need a database or an api key. '''
+
+def load():
+    import sql_config
+    return sql_config
+
+def get(name, default=None):
+    ''' A sql_config setting, default if sql_config does not define it '''
+    return getattr(load(), name, default)
@@ -0,0 +1,244 @@
+''' Local Parquet mirror of primary_sheet and one_min_data for research reads.
+
+Each table is a hive-partitioned dataset with one directory per day, the rows sorted by
+ticker and time so a ticker filter skips most row groups:
+
+    {DATASET_DIR}/one_min_data/day=2023-03-03/part-0.parquet
+    {DATASET_DIR}/primary_sheet/day=2023-03-03/part-0.parquet
+
+sync() asks Postgres for a small fingerprint of every day (row count and sums of the volume
+and every price column for one_min_data, an md5 of the rows for primary_sheet) and only
+rewrites the days whose fingerprint differs from _manifest.json, so a sync after a day of
+ingestion writes a few partitions. Days deleted from the database are removed. By default
+only days from the last synced one on are checked; --since moves that start and --full
+checks the whole history, e.g. after a backfill of older days.
+
+read() / read_frame() push the column selection and the day / ticker filters down to the
+Parquet reader and memory-map the files. to_arrow() saves a result as an uncompressed Arrow
+IPC file which open_arrow() maps back without copying, for data read over and over.
+pyarrow is imported when the dataset is used.
+
+    python -m data_collection dataset sync
+    python -m data_collection dataset sync --since 2023-03-01
+    python -m data_collection dataset sync --full
+    python -m data_collection dataset show --ticker AAPL --start 2023-03-01 --columns date high volume
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+
+# Data analysis and manipulation
+import pandas as pd
+
+# Database management
+from sqlalchemy import text
+
+# ANSI color formatting
+from termcolor import colored
+
+from . import config, instrument
+
+DEFAULT_DATASET_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'data_collection', 'dataset')
+
+TABLES = ('primary_sheet', 'one_min_data')
+
+# The partition key, 'date' is already a column of both tables
+PARTITION_KEY = 'day'
+
+# Per-day fingerprints: cheap aggregates that change when a day's rows are added, replaced or updated
+FINGERPRINTS = {
+    'primary_sheet': '''SELECT p.date AS day, md5(string_agg(p::text, '|' ORDER BY p.id)) AS fingerprint
+                        FROM primary_sheet p {where} GROUP BY p.date''',
+    'one_min_data': '''SELECT p.date::date AS day,
+                              concat_ws(':', count(*), sum(p.volume), sum(p.open::numeric), sum(p.high::numeric),
+                                        sum(p.low::numeric), sum(p.close::numeric)) AS fingerprint
+                       FROM one_min_data p {where} GROUP BY p.date::date''',
+}
+
+# Rows of one day, sorted for the ticker row-group statistics
+DAY_QUERIES = {
+    'primary_sheet': 'SELECT * FROM primary_sheet WHERE date = :day ORDER BY ticker',
+    'one_min_data': '''SELECT * FROM one_min_data WHERE date >= CAST(:day AS date) AND date < CAST(:day AS date) + 1
+                       ORDER BY ticker, date''',
+}
+
+def dataset_dir():
+    ''' DATASET_DIR of sql_config, or the default under ~/.cache '''
+    return config.get('DATASET_DIR', DEFAULT_DATASET_DIR)
+
+def partition_path(root, table, day):
+    return os.path.join(root, table, f'{PARTITION_KEY}={day}', 'part-0.parquet')
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, '_manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {table: {} for table in TABLES}
+
+def save_manifest(root, manifest):
+    path = os.path.join(root, '_manifest.json')
+    os.makedirs(root, exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
+def fingerprints(cnx, table, since=None):
+    ''' {'YYYY-MM-DD': fingerprint} of every day of table, from since on '''
+    where, params = ('WHERE p.date >= :since', {'since': str(since)}) if since is not None else ('', {})
+    with cnx.connect() as conn:
+        rows = conn.execute(text(FINGERPRINTS[table].format(where=where)), params).fetchall()
+    return {str(day): fingerprint for day, fingerprint in rows}
+
+def arrow_schema(table):
+    ''' Fixed Arrow schema of a table whose nullable columns would otherwise be inferred
+    differently from day to day, None to infer it '''
+    import pyarrow as pa
+    if table == 'one_min_data':
+        return pa.schema([('stock_one_min_id', pa.int64()), ('ticker', pa.string()), ('date', pa.timestamp('us')),
+                          ('open', pa.float64()), ('high', pa.float64()), ('low', pa.float64()),
+                          ('close', pa.float64()), ('volume', pa.int64()), ('vwap', pa.float64()),
+                          ('n_of_trades', pa.int32())])
+    return None
+
+def write_partition(root, table, day, frame, row_group_size=65536):
+    ''' Replace the Parquet file of one day, through a temporary file so readers never see a partial one '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = partition_path(root, table, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    pq.write_table(pa.Table.from_pandas(frame, schema=arrow_schema(table), preserve_index=False), tmp_path,
+                   row_group_size=row_group_size)
+    os.replace(tmp_path, path)
+    instrument.count('rows_written', len(frame), table=f'dataset.{table}')
+
+def sync_table(cnx, root, table, manifest, since=None, full=False):
+    ''' Bring one table of the dataset up to date, from since or else the last synced day on
+    (every day with full or an empty manifest). Returns (days written, days removed) '''
+    synced = manifest.setdefault(table, {})
+    if since is None and not full and synced:
+        since = max(synced)
+    current = fingerprints(cnx, table, since)
+    changed = sorted(day for day, fingerprint in current.items() if synced.get(day) != fingerprint)
+    removed = sorted(day for day in synced if day not in current and (since is None or day >= str(since)))
+    try:
+        for day in changed:
+            with instrument.stage('dataset_partition', table=table):
+                frame = pd.read_sql(text(DAY_QUERIES[table]), con=cnx, params={'day': day})
+                write_partition(root, table, day, frame)
+            synced[day] = current[day]
+        for day in removed:
+            shutil.rmtree(os.path.dirname(partition_path(root, table, day)), ignore_errors=True)
+            del synced[day]
+    finally:
+        # An interrupted sync keeps what it wrote and resumes from there
+        save_manifest(root, manifest)
+    return changed, removed
+
+@instrument.timed('dataset_sync')
+def sync(cnx, root=None, since=None, tables=TABLES, full=False):
+    ''' Mirror tables into the Parquet dataset at root, writing only new or changed days.
+    Days before since (by default the last synced day of each table, none with full) are
+    neither checked nor removed. Returns {table: (written, removed)} '''
+    root = root or dataset_dir()
+    manifest = load_manifest(root)
+    return {table: sync_table(cnx, root, table, manifest, since, full) for table in tables}
+
+def filter_expression(start_date=None, end_date=None, tickers=None, where=None):
+    ''' pyarrow filter of the day partitions and tickers, and'ed with an optional expression '''
+    import pyarrow.dataset as ds
+    conditions = []
+    if start_date is not None:
+        conditions.append(ds.field(PARTITION_KEY) >= str(start_date))
+    if end_date is not None:
+        conditions.append(ds.field(PARTITION_KEY) <= str(end_date))
+    if tickers:
+        conditions.append(ds.field('ticker').isin(list(tickers)))
+    if where is not None:
+        conditions.append(where)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def read(table, columns=None, start_date=None, end_date=None, tickers=None, where=None, root=None):
+    ''' An Arrow table of the dataset. Only the partitions of days between start_date and
+    end_date are opened, ticker / where filters skip row groups by their statistics, and
+    only the given columns are decoded. where is a pyarrow.dataset expression, e.g.
+    ds.field('volume') > 100000 '''
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    path = os.path.join(root or dataset_dir(), table)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f'{path} does not exist, run python -m data_collection dataset sync')
+    with instrument.stage('dataset_read', table=table):
+        result = pq.read_table(path, columns=columns, memory_map=True,
+                               partitioning=ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor='hive'),
+                               filters=filter_expression(start_date, end_date, tickers, where))
+    # The partition key is only there when asked for
+    if columns is None and PARTITION_KEY in result.column_names:
+        result = result.drop_columns([PARTITION_KEY])
+    return result
+
+def read_frame(table, columns=None, start_date=None, end_date=None, tickers=None, where=None, root=None):
+    ''' read() as a pandas DataFrame '''
+    return read(table, columns, start_date, end_date, tickers, where, root).to_pandas()
+
+def to_arrow(table, path):
+    ''' Save an Arrow table as an uncompressed Arrow IPC file for open_arrow() '''
+    import pyarrow as pa
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+def open_arrow(path):
+    ''' Memory-map an Arrow IPC file as a table without reading it into memory '''
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+def add_arguments(parser):
+    subparsers = parser.add_subparsers(dest='dataset_command', required=True)
+    sync_parser = subparsers.add_parser('sync', help='write new or changed days to the Parquet dataset')
+    sync_parser.add_argument('--since', help='only check days from this one on, YYYY-MM-DD, '
+                                             'defaults to the last synced day')
+    sync_parser.add_argument('--full', action='store_true', help='check every day, e.g. after a backfill')
+    sync_parser.add_argument('--table', choices=TABLES, nargs='+', default=list(TABLES))
+    sync_parser.add_argument('--root', help='dataset directory, defaults to DATASET_DIR in sql_config')
+    show_parser = subparsers.add_parser('show', help='read rows from the Parquet dataset')
+    show_parser.add_argument('--table', choices=TABLES, default='one_min_data')
+    show_parser.add_argument('--ticker', nargs='+', type=str.upper)
+    show_parser.add_argument('--start', help='first day, YYYY-MM-DD')
+    show_parser.add_argument('--end', help='last day, YYYY-MM-DD')
+    show_parser.add_argument('--columns', nargs='+', help='columns to read, all by default')
+    show_parser.add_argument('--root', help='dataset directory, defaults to DATASET_DIR in sql_config')
+    show_parser.add_argument('--output', help='write the rows to this csv, or .arrow file for open_arrow()')
+
+def run(args):
+    if args.dataset_command == 'sync':
+        from . import store
+        for table, (written, removed) in sync(store.engine_from_config(), args.root, args.since, args.table, args.full).items():
+            print(colored(f'{table}: {len(written)} days written, {len(removed)} removed', 'cyan'))
+    elif args.dataset_command == 'show':
+        result = read(args.table, args.columns, args.start, args.end, args.ticker, root=args.root)
+        if args.output and args.output.endswith('.arrow'):
+            to_arrow(result, args.output)
+            print(f'{result.num_rows} rows written to {args.output}')
+        elif args.output:
+            result.to_pandas().to_csv(args.output, index=False)
+            print(f'{result.num_rows} rows written to {args.output}')
+        else:
+            print(result.to_pandas().to_string(index=False))
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parquet mirror of primary_sheet and one_min_data')
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+''' Download a ticker-day and turn it into a primary_sheet row. '''
+
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+from . import bars, config, reference_data
+from .bar_cache import cache_from_config
+from .metrics import hod_volbo_5mins_high
+from .polygon_client import POLYGON_BASE_URL, PolygonClient, exchange_name
+
+def client_from_config(pool_size=16, calls_per_minute=None, retries=5):
+    ''' A PolygonClient with the api key, rate limit and cache settings of sql_config '''
+    if calls_per_minute is None:
+        calls_per_minute = config.get('POLYGON_CALLS_PER_MINUTE')
+    return PolygonClient(config.get('API_KEY'), calls_per_minute=calls_per_minute,
+                         pool_size=pool_size, retries=retries, cache=cache_from_config(),
+                         base_url=config.get('POLYGON_BASE_URL', POLYGON_BASE_URL))
+
+def daily_inputs(client, ticker, starting_date, ending_date):
+    ''' The day -1 and day +0 primary_sheet columns of one ticker from its daily bars,
+    with the keys of grouped_daily.DAILY_COLUMNS. Raises ValueError if either day has no bar '''
+    df_input = client.aggregates(ticker, 'day', starting_date, ending_date)
+    daily_dates = df_input['Date'].dt.strftime('%Y-%m-%d')
+    for date in (starting_date, ending_date):
+        if not (daily_dates == date).any():
+            raise ValueError(f'no daily aggregates for {ticker} on {date}')
+    df_today_daily = df_input.loc[daily_dates == ending_date].iloc[0]
+    df_yesterday_daily = df_input.loc[daily_dates == starting_date].iloc[0]
+    return {
+        'weekday': df_today_daily['Date'].day_name(),
+        'date': ending_date,
+        'dv': int(df_today_daily['Volume']),
+        'prior_day_vol': int(df_yesterday_daily['Volume']),
+        'prior_day_vwap': bars.price(df_yesterday_daily['Vwap']),
+        'prev_close': bars.price(df_yesterday_daily['Close']),
+        'open': bars.price(df_today_daily['Open']),
+        'low': bars.price(df_today_daily['Low']),
+        'high': bars.price(df_today_daily['High']),
+        'close': bars.price(df_today_daily['Close']),
+    }
+
+def breakout_inputs(df_plot, ticker, ending_date):
+    ''' five_mins_high, vol_b4_bo and hod of a ticker-day's 1min bars as primary_sheet values.
+    Raises ValueError without 9:30-9:34 candles (e.g. an opening halt), which leave no breakout level '''
+    day_metrics = hod_volbo_5mins_high(df_plot)
+    if len(day_metrics) == 0:
+        raise ValueError(f'{ticker} {ending_date}: no 9:30-9:34 candles')
+    day_metrics = day_metrics.iloc[0]
+    if not np.isfinite(day_metrics['five_mins_high']) or pd.isna(day_metrics['hod']):
+        raise ValueError(f'{ticker} {ending_date}: no 9:30-9:34 candles')
+    return {'five_mins_high': bars.price(day_metrics['five_mins_high']),
+            'vol_b4_bo': int(day_metrics['vol_b4_bo']),
+            'hod': day_metrics['hod'].strftime('%H:%M:%S')}
+
+def fetch_ticker_day(client, ticker, starting_date, ending_date, cnx=None, b_run_up_low=None, run_up_high=None,
+                     daily=None):
+    ''' Download and compute one primary_sheet row. Returns (row dict, 1min DataFrame).
+    Exchange, shares outstanding and sector come from the reference store when cnx is given.
+    daily is the ticker's row of grouped_daily.day_pair, if it was already downloaded.
+    Raises ValueError when Polygon has no shares outstanding (OTC), which option 1 asks for by hand,
+    when the day has no 9:30-9:34 candles or when the sector is unavailable '''
+    # Get intraday data and day-1 / day+0 daily chart price data
+    df_plot = client.aggregates(ticker, 'minute', ending_date, ending_date)
+    day_metrics = breakout_inputs(df_plot, ticker, ending_date)
+    if daily is None:
+        daily = daily_inputs(client, ticker, starting_date, ending_date)
+
+    # Get exchange and weighted shares outstanding
+    results = reference_data.ticker_details(cnx, client, ticker, ending_date)
+    weighted_shares_oustanding = results.get('weighted_shares_outstanding')
+    if not isinstance(weighted_shares_oustanding, (int, float)):
+        raise ValueError('Polygon.io API can\'t find shares_outstanding (OTC?), enter this ticker through the menu')
+
+    row = {
+        'weekday': daily['weekday'],
+        'date': ending_date,
+        'ticker': ticker,
+        'exchange': exchange_name(results.get('primary_exchange')),
+        'industry': reference_data.sector(cnx, client, ticker),
+        'so': int(weighted_shares_oustanding),
+        'dv': int(daily['dv']),
+        'prior_day_vol': int(daily['prior_day_vol']),
+        'prior_day_vwap': float(daily['prior_day_vwap']),
+        'b_run_up_low': b_run_up_low,
+        'run_up_high': run_up_high,
+        'prev_close': float(daily['prev_close']),
+        'open': float(daily['open']),
+        'low': float(daily['low']),
+        'five_mins_high': day_metrics['five_mins_high'],
+        'high': float(daily['high']),
+        'close': float(daily['close']),
+        'vol_b4_bo': day_metrics['vol_b4_bo'],
+        'hod': day_metrics['hod']
+    }
+    return row, df_plot
@@ -0,0 +1,78 @@
+''' Market-wide day -1 / day +0 inputs of primary_sheet from Polygon's grouped daily bars.
+
+One request per date returns the daily bar of every US stock, instead of one
+/range/1/day request per ticker. Each date is cached as a Parquet file by bar_cache,
+and the gap and prior day dollar volume of every ticker are computed column-wise,
+with the same formulas as the generated columns of primary_sheet.
+
+    python -m data_collection gappers 2023-03-03 --min-gap 0.2 --output jobs.csv
+'''
+
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+from . import bars
+
+# primary_sheet inputs of day_pair, in primary_sheet order
+DAILY_COLUMNS = ['weekday','date','dv','prior_day_vol','prior_day_vwap','prev_close','open','low','high','close']
+
+def previous_session(client, date, max_days=10):
+    ''' (date, grouped bars) of the last session before date. Weekends and market holidays
+    are skipped without a request, unscheduled closures are recognised by their empty grouped bars '''
+    day = pd.Timestamp(date)
+    for _ in range(max_days):
+        day -= pd.Timedelta(days=1)
+        if not bars.is_trading_day(day):
+            continue
+        session = client.grouped_daily(day.strftime('%Y-%m-%d'))
+        if len(session):
+            return day.strftime('%Y-%m-%d'), session
+    raise ValueError(f'no session in the {max_days} days before {date}')
+
+def day_pair(client, ending_date, starting_date=None):
+    ''' The daily primary_sheet inputs of every ticker traded on day -1 (starting_date,
+    the previous session by default) and day +0 (ending_date), indexed by ticker.
+    Also has start_date / end_date, gap and prior_day_dollar_vol columns '''
+    today = client.grouped_daily(ending_date).set_index('ticker')
+    if starting_date is None:
+        starting_date, yesterday = previous_session(client, ending_date)
+    else:
+        yesterday = client.grouped_daily(starting_date)
+    yesterday = yesterday.set_index('ticker')
+
+    # Tickers traded on both days
+    tickers = today.index.intersection(yesterday.index)
+    today, yesterday = today.loc[tickers], yesterday.loc[tickers]
+
+    def prices(column):
+        # float32 bars back to Polygon's 4 decimals in float64
+        return np.round(column.to_numpy(dtype='float64'), bars.PRICE_DECIMALS)
+
+    pair = pd.DataFrame({
+        'weekday': pd.Timestamp(ending_date).day_name(),
+        'date': ending_date,
+        'dv': today['Volume'].to_numpy(dtype='int64'),
+        'prior_day_vol': yesterday['Volume'].to_numpy(dtype='int64'),
+        'prior_day_vwap': prices(yesterday['Vwap']),
+        'prev_close': prices(yesterday['Close']),
+        'open': prices(today['Open']),
+        'low': prices(today['Low']),
+        'high': prices(today['High']),
+        'close': prices(today['Close']),
+    }, index=tickers)
+    pair.index.name = 'ticker'
+
+    # Same formulas as the generated columns of primary_sheet
+    pair['gap'] = (pair['open'] - pair['prev_close']) / pair['prev_close']
+    pair['prior_day_dollar_vol'] = (pair['prior_day_vol'] * pair['prior_day_vwap']).round().astype('int64')
+    pair.insert(0, 'start_date', starting_date)
+    pair.insert(1, 'end_date', ending_date)
+    return pair
+
+def gappers(client, ending_date, starting_date=None, min_gap=0.0, min_prior_dollar_vol=0, min_open=0.0):
+    ''' Tickers gapping up at least min_gap on ending_date, largest gap first '''
+    pair = day_pair(client, ending_date, starting_date)
+    keep = ((pair['gap'] >= min_gap) & (pair['prior_day_dollar_vol'] >= min_prior_dollar_vol)
+            & (pair['open'] >= min_open))
+    return pair.loc[keep].sort_values('gap', ascending=False)
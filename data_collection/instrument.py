@@ -0,0 +1,182 @@
+''' Lightweight timing and counters for the ingestion pipeline.
+
+Stages (Polygon calls, sector lookups, metrics, duplicate check, writes) are timed
+with stage() / timed(), and HTTP requests, bytes, retries, cache hits and rows
+written are counted with count(). Everything lives in one process-wide registry:
+
+- every finished stage is logged as one json line on the 'data_collection' logger
+  (silent unless logging is configured, see log_json())
+- prometheus_text() renders the registry in the Prometheus text format, for
+  write_prometheus(path) or the serve_prometheus(port) endpoint
+- profile(path) runs a block under cProfile and saves the stats
+
+The CLI exposes these as --log-json, --metrics-file, --metrics-port and --profile.
+'''
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'data_collection'
+
+logger = logging.getLogger('data_collection')
+
+class Registry:
+    ''' Thread-safe counters and stage timings keyed by (name, labels) '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        # (stage, labels) -> [count, total seconds, max seconds]
+        self.timings = {}
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, tuple(sorted(labels.items())))
+        with self.lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def snapshot(self):
+        ''' Plain dict of the registry, for logs and run summaries '''
+        with self.lock:
+            return {
+                'counters': {format_key(name, labels): value for (name, labels), value in self.counters.items()},
+                'stages': {format_key(stage, labels): {'count': count, 'total_s': round(total, 6), 'max_s': round(peak, 6)}
+                           for (stage, labels), (count, total, peak) in self.timings.items()},
+            }
+
+registry = Registry()
+
+def format_key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def count(name, value=1, **labels):
+    ''' Add value to a counter, e.g. count('rows_written', len(frame), table='one_min_data') '''
+    registry.count(name, value, **labels)
+
+def observe(name, seconds, **labels):
+    ''' Record a duration without a log line, for high-volume events like HTTP requests '''
+    registry.observe(name, seconds, **labels)
+
+def log_event(event, **fields):
+    ''' One structured (json) log line '''
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': event, **fields}, default=str))
+
+@contextmanager
+def stage(name, **labels):
+    ''' Time a block as a pipeline stage. Failures are timed too and counted as stage_errors '''
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        registry.count('stage_errors', stage=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe(name, seconds, **labels)
+        log_event('stage', stage=name, seconds=round(seconds, 6), status=status, **labels)
+
+def timed(name):
+    ''' Decorator timing every call of a function as stage name '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def prometheus_text():
+    ''' The registry in the Prometheus text exposition format '''
+    with registry.lock:
+        snapshot_counters = sorted(registry.counters.items())
+        snapshot_timings = sorted(registry.timings.items())
+    lines = []
+    seen = set()
+    for (name, labels), value in snapshot_counters:
+        metric = f'{PREFIX}_{name}_total'
+        if metric not in seen:
+            lines.append(f'# TYPE {metric} counter')
+            seen.add(metric)
+        lines.append(f'{format_key(metric, labels)} {value}')
+    if snapshot_timings:
+        lines.append(f'# TYPE {PREFIX}_stage_seconds summary')
+        for (stage_name, labels), (calls, total, _) in snapshot_timings:
+            stage_labels = (('stage', stage_name),) + labels
+            lines.append(f'{format_key(PREFIX + "_stage_seconds_count", stage_labels)} {calls}')
+            lines.append(f'{format_key(PREFIX + "_stage_seconds_sum", stage_labels)} {total:.6f}')
+        lines.append(f'# TYPE {PREFIX}_stage_seconds_max gauge')
+        for (stage_name, labels), (_, _, peak) in snapshot_timings:
+            lines.append(f'{format_key(PREFIX + "_stage_seconds_max", (("stage", stage_name),) + labels)} {peak:.6f}')
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path):
+    ''' Write prometheus_text() to path, e.g. for the node_exporter textfile collector '''
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(prometheus_text())
+    # Replace in one step so a scrape never reads a partial file
+    os.replace(tmp_path, path)
+
+def serve_prometheus(port, host='0.0.0.0'):
+    ''' Serve prometheus_text() on http://host:port/metrics from a daemon thread '''
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            payload = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def log_json(level=logging.INFO, stream=None):
+    ''' Print the structured logs, one json object per line '''
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+
+@contextmanager
+def profile(path, top=25):
+    ''' Run a block under cProfile, save the stats to path (for snakeviz / pstats) and
+    print the top functions by cumulative time '''
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
@@ -0,0 +1,235 @@
+''' Live session mode: follow the current day of a ticker bar by bar.
+
+A source yields frames of new, completed 1min bars: PollingSource asks Polygon only for
+the bars after the last one it has seen, ReplaySource plays a finished day back as if it
+were live. LiveSession feeds every bar to BreakoutState, which keeps the 5mins high, HOD,
+breakout and volume before breakout up to date in constant time per bar (the definitions
+of metrics.hod_volbo_5mins_high), appends the bars to one_min_data every batch_size bars
+and extends a LiveChart in place.
+
+    python -m data_collection live AAPL --output live.html
+    python -m data_collection live AAPL --date 2023-03-03 --replay --speed 60 --output live.html
+'''
+import os
+import time
+
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+from . import bars, instrument, store
+from .metrics import FIVE_MINS, MARKET_CLOSE, MARKET_OPEN
+from .polygon_client import aggregates_to_frame
+
+class BreakoutState:
+    ''' Breakout metrics of one ticker-day updated bar by bar in O(1). Bars must arrive in time order '''
+
+    def __init__(self):
+        self.day = None
+        self.five_mins_high = -np.inf
+        self.day_high = -np.inf
+        self.hod = None
+        self.breakout = None
+        self.vol_b4_bo = 0
+        # Volume of the day before the next bar
+        self.volume = 0
+
+    def update(self, date, high, volume):
+        ''' Add one bar (Eastern wall-clock Timestamp). Returns True if it is the breakout candle '''
+        if self.day is None:
+            self.day = date.normalize()
+        minute = date.hour * 60 + date.minute
+        is_breakout = False
+        # 5mins high: the 9:30-9:34 candles, complete before any breakout candidate arrives
+        if MARKET_OPEN <= minute < FIVE_MINS:
+            self.five_mins_high = max(self.five_mins_high, high)
+        if MARKET_OPEN <= minute <= MARKET_CLOSE:
+            # HOD: only a strictly higher high moves it, so it stays on the first candle
+            if high > self.day_high:
+                self.day_high, self.hod = high, date
+            # No breakout without a 5mins high, e.g. when the opening candles are missing
+            if (self.breakout is None and minute >= FIVE_MINS and np.isfinite(self.five_mins_high)
+                    and high > self.five_mins_high):
+                self.breakout, self.vol_b4_bo = date, self.volume
+                is_breakout = True
+        self.volume += volume
+        return is_breakout
+
+    def metrics(self):
+        ''' The current values as a row of metrics.hod_volbo_5mins_high '''
+        return {'date': self.day,
+                'five_mins_high': float(self.five_mins_high) if np.isfinite(self.five_mins_high) else np.nan,
+                'hod': self.hod if self.hod is not None else pd.NaT,
+                'breakout': self.breakout if self.breakout is not None else pd.NaT,
+                'vol_b4_bo': int(self.vol_b4_bo)}
+
+class PollingSource:
+    ''' Completed 1min bars of ticker on day from Polygon, polled every interval seconds.
+    Every poll asks for the bars from the minute after the last one seen (a millisecond
+    'from' timestamp), bypassing the aggregate cache. The bar of the current minute is held
+    back until it is over. Ends once the extended session is closed '''
+
+    def __init__(self, client, ticker, day, interval=5.0, since=None, clock=time.time):
+        self.client = client
+        self.ticker = ticker
+        self.day = str(day)
+        self.interval = interval
+        self.clock = clock
+        session = pd.Timestamp(self.day, tz=bars.EASTERN)
+        start = since + pd.Timedelta(minutes=1) if since is not None else session
+        self.next_ms = start.value // 1_000_000
+        self.session_end_ms = (session + bars.SESSION_END).value // 1_000_000
+
+    def poll(self):
+        ''' The completed bars since the last poll, None if there are none yet '''
+        with instrument.stage('live_poll'):
+            results = [result for page in self.client.aggregate_pages(self.ticker, 'minute', self.next_ms, self.day)
+                       for result in page]
+        now_ms = int(self.clock() * 1000)
+        results = [result for result in results if self.next_ms <= result['t'] and result['t'] + 60_000 <= now_ms]
+        if not results:
+            return None
+        self.next_ms = results[-1]['t'] + 60_000
+        return aggregates_to_frame({'results': results})
+
+    def __iter__(self):
+        while True:
+            frame = self.poll()
+            if frame is not None:
+                yield frame
+            if self.clock() * 1000 >= self.session_end_ms:
+                return
+            time.sleep(self.interval)
+
+class ReplaySource:
+    ''' The bars of a finished day, batch bars at a time and speed times faster than real
+    time (as fast as possible when speed is None), standing in for a live stream '''
+
+    def __init__(self, frame, batch=1, speed=None, sleep=time.sleep):
+        self.frame = frame
+        self.batch = batch
+        self.speed = speed
+        self.sleep = sleep
+
+    def __iter__(self):
+        for start in range(0, len(self.frame), self.batch):
+            if self.speed and start:
+                self.sleep(60 * self.batch / self.speed)
+            yield self.frame.iloc[start:start + self.batch]
+
+class LiveChart:
+    ''' 1min candlestick + volume chart of a live session, extended in place. Without output
+    the figure is a FigureWidget (Jupyter) whose traces are updated; with output it is
+    rewritten to that html file, which reloads itself every refresh seconds '''
+
+    def __init__(self, ticker, day, output=None, refresh=5):
+        self.ticker = ticker
+        self.day = day
+        self.output = output
+        self.refresh = refresh
+        self.fig = None
+        self.frames = []
+
+    def extend(self, frame, state):
+        ''' Add new bars and redraw the 5mins high and breakout markers '''
+        from .plot import chart_figure, session_shapes
+
+        self.frames.append(frame)
+        plot_data = pd.concat(self.frames, ignore_index=True)
+        self.frames = [plot_data]
+        if self.fig is None:
+            self.fig = chart_figure(plot_data, '1min', self.ticker, self.day)
+            if self.output is None:
+                import plotly.graph_objects as go
+                from IPython.display import display
+                self.fig = go.FigureWidget(self.fig)
+                display(self.fig)
+        dates = bars.wall_clock(plot_data['Date'])
+        shapes = session_shapes(dates)
+        if np.isfinite(state.five_mins_high):
+            shapes.append(dict(type='line', xref='x domain', yref='y', x0=0, x1=1, y0=state.five_mins_high,
+                               y1=state.five_mins_high, line={'color':'orange', 'dash':'dash', 'width':1}))
+        if state.breakout is not None:
+            shapes.append(dict(type='line', xref='x', yref='y domain', x0=state.breakout, x1=state.breakout,
+                               y0=0, y1=1, line={'color':'orange', 'width':1}))
+        # Only the trace data and shapes change, the figure itself is not rebuilt
+        with self.fig.batch_update():
+            candles, volume = self.fig.data[0], self.fig.data[1]
+            candles.x, volume.x = dates, dates
+            candles.open, candles.high = plot_data['Open'], plot_data['High']
+            candles.low, candles.close = plot_data['Low'], plot_data['Close']
+            volume.y = plot_data['Volume']
+            self.fig.layout.shapes = shapes
+        if self.output is not None:
+            tmp_path = f'{self.output}.tmp.html'
+            self.fig.write_html(tmp_path, include_plotlyjs='directory',
+                                post_script=f'setTimeout(function() {{ location.reload(); }}, {self.refresh * 1000});')
+            # Replace in one step so a reload never reads a partial file
+            os.replace(tmp_path, self.output)
+
+class LiveSession:
+    ''' Follow one ticker-day: metrics per bar, bars appended to one_min_data (when cnx is
+    given) every batch_size bars, and an optional LiveChart. on_breakout(session) is called
+    once, on the breakout candle '''
+
+    def __init__(self, ticker, day, cnx=None, chart=None, batch_size=5, on_breakout=None):
+        self.ticker = ticker
+        self.day = str(day)
+        self.cnx = cnx
+        self.chart = chart
+        self.batch_size = batch_size
+        self.on_breakout = on_breakout
+        self.state = BreakoutState()
+        self.last_bar = None
+        self.pending = []
+        self.day_ids = {}
+        if cnx is not None:
+            with cnx.connect() as conn:
+                self.day_ids = store.primary_keys(conn, ticker, self.day, self.day)
+
+    def resume(self):
+        ''' Feed the bars of the day already in one_min_data (from an earlier run) to the
+        metrics and the chart. Returns the time of the last one, None if there are none '''
+        if self.cnx is None:
+            return None
+        stored = store.read_bars(self.cnx, 'one_min_data', store.ONE_MIN_COLUMNS[2:], self.ticker, self.day)
+        if len(stored):
+            self.add(stored, save=False)
+        return self.last_bar
+
+    def add(self, frame, save=True):
+        ''' Update the metrics with new bars, then queue them for storage and redraw the chart '''
+        if len(frame) == 0:
+            return
+        dates = bars.wall_clock(frame['Date'])
+        for date, high, volume in zip(dates, frame['High'].to_numpy('float64'), frame['Volume'].to_numpy()):
+            if self.state.update(date, high, volume) and self.on_breakout is not None:
+                self.on_breakout(self)
+        self.last_bar = frame['Date'].iloc[-1]
+        instrument.count('live_bars', len(frame))
+        if save and self.cnx is not None:
+            self.pending.append(frame)
+            if sum(len(pending) for pending in self.pending) >= self.batch_size:
+                self.flush()
+        if self.chart is not None:
+            with instrument.stage('live_chart'):
+                self.chart.extend(frame, self.state)
+
+    def flush(self):
+        ''' Append the queued bars to one_min_data in one transaction '''
+        if not self.pending:
+            return
+        batch = pd.concat(self.pending, ignore_index=True)
+        self.pending = []
+        store.replace_one_min_data(self.cnx, self.ticker, batch, self.day_ids, stage='live_store')
+
+    def run(self, source):
+        ''' Consume a source until it ends (or is interrupted), storing what is queued.
+        Returns the final metrics '''
+        try:
+            for frame in source:
+                self.add(frame)
+        finally:
+            if self.cnx is not None:
+                self.flush()
+        return self.state.metrics()
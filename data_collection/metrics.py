@@ -0,0 +1,85 @@
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+# Canonical bar schema
+from . import bars, instrument
+
+# Market session boundaries as minutes after midnight (US/Eastern)
+MARKET_OPEN = 9 * 60 + 30
+FIVE_MINS = MARKET_OPEN + 5
+MARKET_CLOSE = 16 * 60
+
+def eastern_datetime64(dates):
+    ''' Eastern wall-clock datetime64[ns] array from tz-aware or naive Eastern datetimes '''
+    return bars.wall_clock(pd.to_datetime(pd.Series(dates))).to_numpy('datetime64[ns]')
+
+@instrument.timed('metrics')
+def hod_volbo_5mins_high(voldata):
+    ''' 5mins high / high of the day / breakout / volume before breakout for every ticker-day.
+
+    voldata holds 1min bars with 'Date', 'High' and 'Volume' columns, and optionally a
+    'ticker' column, for any number of days. Returns one row per ticker-day with
+    date, five_mins_high (high of the 9:30-9:34 candles), hod (time of the first
+    market-hours high), breakout (first candle from 9:35 to 16:00 with a high above
+    the 5mins high, NaT if none) and vol_b4_bo (all volume of the day before the
+    breakout candle, 0 if none). A ticker-day without 9:30-9:34 candles has a NaN
+    five_mins_high and no breakout, as in the breakout_metrics view. '''
+    columns = ['date','five_mins_high','hod','breakout','vol_b4_bo']
+    if len(voldata) == 0:
+        return pd.DataFrame(columns=(['ticker'] if 'ticker' in voldata.columns else []) + columns)
+    dates = eastern_datetime64(voldata['Date'])
+    high = voldata['High'].to_numpy(dtype='float64')
+    volume = voldata['Volume'].to_numpy(dtype='float64')
+    days = dates.astype('datetime64[D]')
+    minute = ((dates - days) // np.timedelta64(1, 'm')).astype('int64')
+    if 'ticker' in voldata.columns:
+        tickers, ticker_names = pd.factorize(voldata['ticker'])
+    else:
+        tickers, ticker_names = np.zeros(len(voldata), dtype='int64'), None
+
+    # Sort by ticker and time, then find where every ticker-day starts
+    order = np.lexsort((dates, tickers))
+    dates, high, volume, days, minute, tickers = (a[order] for a in (dates, high, volume, days, minute, tickers))
+    n = len(dates)
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = (tickers[1:] != tickers[:-1]) | (days[1:] != days[:-1])
+    starts = np.flatnonzero(new_group)
+    group = np.cumsum(new_group) - 1
+    position = np.arange(n)
+
+    # 5mins high: first candle will be at 9:30, so last candle should be 9:34
+    opening = (minute >= MARKET_OPEN) & (minute < FIVE_MINS)
+    five_mins_high = np.maximum.reduceat(np.where(opening, high, -np.inf), starts)
+
+    # HOD: first candle reaching the market-hours high
+    market = (minute >= MARKET_OPEN) & (minute <= MARKET_CLOSE)
+    market_high = np.where(market, high, -np.inf)
+    day_high = np.maximum.reduceat(market_high, starts)
+    is_hod = market & (market_high == day_high[group])
+    hod_at = np.minimum.reduceat(np.where(is_hod, position, n), starts)
+
+    # Breakout: first candle after 9:35 with a high above the 5mins high. Without 9:30-9:34
+    # candles (a halt or a late first print) there is no 5mins high and no breakout
+    after = (minute >= FIVE_MINS) & (minute <= MARKET_CLOSE)
+    is_breakout = after & np.isfinite(five_mins_high[group]) & (high > five_mins_high[group])
+    breakout_at = np.minimum.reduceat(np.where(is_breakout, position, n), starts)
+
+    # Volume before breakout from the cumulative volume of the ticker-day
+    cum_volume = np.cumsum(volume)
+    before_day = cum_volume[starts] - volume[starts]
+    has_breakout = breakout_at < n
+    safe_breakout = np.where(has_breakout, breakout_at, 0)
+    vol_b4_bo = np.where(has_breakout, cum_volume[safe_breakout] - volume[safe_breakout] - before_day, 0)
+
+    nat = np.datetime64('NaT', 'ns')
+    result = pd.DataFrame({
+        'date': days[starts],
+        'five_mins_high': np.where(np.isfinite(five_mins_high), five_mins_high, np.nan),
+        'hod': np.where(hod_at < n, dates[np.minimum(hod_at, n - 1)], nat),
+        'breakout': np.where(has_breakout, dates[safe_breakout], nat),
+        'vol_b4_bo': vol_b4_bo.astype('int64'),
+    })
+    if ticker_names is not None:
+        result.insert(0, 'ticker', np.asarray(ticker_names)[tickers[starts]])
+    return result
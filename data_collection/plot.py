@@ -0,0 +1,172 @@
+''' Candlestick + volume charts. plotly is imported when a chart is drawn.
+
+Charts of more bars than fit on the screen are downsampled before plotting: bars are
+merged into buckets (within a day) keeping the first open, the highest high, the lowest
+low, the last close and the summed volume, so no spike disappears. With start / end
+only the visible range is sent to the browser. Past WEBGL_THRESHOLD bars the volume
+is drawn as a WebGL trace.
+
+export_charts renders a list of ticker-days to html / png files in worker processes:
+
+    python -m data_collection export review.csv --output-dir charts --timeframe 5min --format png
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Data analysis and manipulation
+import pandas as pd
+import numpy as np
+
+from . import bars
+
+# About one candle per horizontal pixel of a full screen chart
+MAX_BARS = 1500
+
+# Volume bars above this many bars are drawn with WebGL
+WEBGL_THRESHOLD = 1000
+
+def downsample_ohlc(plot_data, max_bars=MAX_BARS):
+    ''' Merge consecutive bars of the same day into buckets so that at most about max_bars
+    remain. Every bucket keeps its first Date and Open, max High, min Low, last Close and
+    summed Volume '''
+    n = len(plot_data)
+    if n <= max_bars:
+        return plot_data
+    # Buckets never span two days, so a day's open and close candles stay where they were
+    size = int(np.ceil(n / max_bars))
+    dates = bars.wall_clock(plot_data['Date']).to_numpy('datetime64[ns]')
+    days = dates.astype('datetime64[D]')
+    position = np.arange(n)
+    new_day = np.ones(n, dtype=bool)
+    new_day[1:] = days[1:] != days[:-1]
+    day_start = np.maximum.accumulate(np.where(new_day, position, 0))
+    starts = np.flatnonzero((position - day_start) % size == 0)
+    ends = np.append(starts[1:], n) - 1
+
+    return pd.DataFrame({
+        'Date': plot_data['Date'].to_numpy()[starts],
+        'Open': plot_data['Open'].to_numpy()[starts],
+        'High': np.maximum.reduceat(plot_data['High'].to_numpy(), starts),
+        'Low': np.minimum.reduceat(plot_data['Low'].to_numpy(), starts),
+        'Close': plot_data['Close'].to_numpy()[ends],
+        'Volume': np.add.reduceat(plot_data['Volume'].to_numpy(), starts),
+    })
+
+def visible_range(plot_data, start=None, end=None):
+    ''' Bars between start and end (Eastern wall-clock time, either may be None) '''
+    if start is None and end is None:
+        return plot_data
+    dates = bars.wall_clock(plot_data['Date'])
+    keep = pd.Series(True, index=plot_data.index)
+    if start is not None:
+        keep &= dates >= pd.Timestamp(start)
+    if end is not None:
+        keep &= dates <= pd.Timestamp(end)
+    return plot_data.loc[keep.to_numpy()]
+
+def session_shapes(dates):
+    ''' Grey rectangles over the pre-market and post-hour bars of every day in dates
+    (Eastern wall-clock Series), as layout shapes '''
+    before_market_open = pd.Timedelta(hours=9, minutes=29)
+    after_market_close = pd.Timedelta(hours=16, minutes=1)
+    shapes = []
+    for day, day_dates in dates.groupby(dates.dt.normalize()):
+        shapes.append((day_dates.iloc[0], day + before_market_open))
+        shapes.append((day + after_market_close, day_dates.iloc[-1]))
+    return [dict(type='rect', xref='x', yref='y domain', x0=x0, x1=x1, y0=0, y1=1,
+                 fillcolor='grey', opacity=0.25, line_width=0) for x0, x1 in shapes]
+
+def chart_figure(plot_data,Questioning_tframe,ticker,ending_date,start=None,end=None,max_bars=MAX_BARS):
+    ''' Candlestick + volume figure of the bars between start and end, downsampled to max_bars '''
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    plot_data = downsample_ohlc(visible_range(plot_data, start, end), max_bars)
+
+    dates = bars.wall_clock(plot_data['Date'])
+
+    # Create subplots and mention plot grid size
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03,row_width=[0.2, 0.7],)
+
+    # Plot OHLC (Open-High-Low-Close) on 1st row
+    fig.add_trace(go.Candlestick(x=dates, open=plot_data["Open"], high=plot_data["High"],
+                   low=plot_data["Low"], close=plot_data["Close"],increasing_line_color = 'green',
+                   decreasing_line_color='red'),row=1, col=1)
+
+    # Add grey area for pre-market and post-hour of every day on the 1st row, if the timeframe is not 1 hour
+    if Questioning_tframe.lower() != '1h':
+        # Added in one layout update, add_vrect per day is slow on long ranges
+        fig.update_layout(shapes=session_shapes(dates))
+
+    # Plot volumes on 2nd row without legend, as WebGL steps when there are many bars
+    if len(plot_data) > WEBGL_THRESHOLD:
+        fig.add_trace(go.Scattergl(x=dates, y=plot_data['Volume'], mode='lines', line_shape='hv', fill='tozeroy',
+                                   line={'color':'#0000FF', 'width':1}, showlegend=False), row=2, col=1)
+    else:
+        fig.add_trace(go.Bar(x=dates, y=plot_data['Volume'],marker={"color":'#0000FF'},showlegend=False), row=2, col=1)
+
+    # Update plot layout
+    fig.update(layout_xaxis_rangeslider_visible=False,layout_showlegend=False)
+    fig.update_layout(title=f'{ticker} {Questioning_tframe} chart {ending_date}',title_x=0.5, xaxis_rangeslider_visible =False)
+    return fig
+
+def write_chart(fig, output):
+    ''' Save a figure as .html, or as an image (png, svg, ...) through kaleido '''
+    if output.endswith('.html'):
+        # plotly.js is written once next to the charts instead of being embedded in every file
+        fig.write_html(output, include_plotlyjs='directory')
+    else:
+        fig.write_image(output)
+
+def plotly_1min_chart(plot_data,Questioning_tframe,ticker,ending_date,output=None,start=None,end=None,max_bars=MAX_BARS):
+    ''' Chart the bars of one or more days. Shown interactively, or written to output
+    (.html, or an image format supported by kaleido) when given '''
+    fig = chart_figure(plot_data,Questioning_tframe,ticker,ending_date,start,end,max_bars)
+
+    # Show or save plot
+    if output is None:
+        fig.show()
+    else:
+        write_chart(fig, output)
+    return fig
+
+def timeframe_plot(levels,Questioning_tframe,ticker,ending_date,output=None,start=None,end=None,max_bars=MAX_BARS):
+    ''' Chart one timeframe of a bar pyramid (see pyramid.py) '''
+    return plotly_1min_chart(levels[Questioning_tframe.lower()],Questioning_tframe,ticker,ending_date,output,
+                             start,end,max_bars)
+
+# Per worker process database engine and Polygon client, created once by export_worker_init
+_worker = {}
+
+def export_worker_init(use_db):
+    from . import store
+    from .fetch import client_from_config
+    _worker['cnx'] = store.engine_from_config() if use_db else None
+    _worker['client'] = client_from_config()
+
+def export_chart(ticker, date, timeframe, output):
+    ''' Render one ticker-day in a worker process, from the database when stored, else from the API '''
+    from . import pyramid, store
+    levels = None
+    if _worker.get('cnx') is not None:
+        levels = store.read_pyramid(_worker['cnx'], ticker, date)
+    if levels is None:
+        levels = pyramid.build_pyramid(_worker['client'].aggregates(ticker, 'minute', date, date))
+    write_chart(chart_figure(levels[timeframe], timeframe, ticker, date), output)
+    return output
+
+def export_charts(ticker_days, output_dir, timeframe='1min', fmt='html', workers=None, use_db=True):
+    ''' Render (ticker, date) pairs to {output_dir}/{ticker}_{date}_{timeframe}.{fmt} in parallel
+    processes. Returns (written files, {(ticker, date): error}) '''
+    os.makedirs(output_dir, exist_ok=True)
+    written, failed = [], {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=export_worker_init, initargs=(use_db,)) as executor:
+        futures = {executor.submit(export_chart, ticker, date, timeframe,
+                                   os.path.join(output_dir, f'{ticker}_{date}_{timeframe}.{fmt}')): (ticker, date)
+                   for ticker, date in ticker_days}
+        for future in as_completed(futures):
+            try:
+                written.append(future.result())
+            except Exception as e:
+                failed[futures[future]] = e
+    return written, failed
@@ -0,0 +1,194 @@
+# Thread-safe rate limiting
+import threading
+import time
+
+# Data analysis and manipulation
+import pandas as pd
+
+# HTTP session with keep-alive connection pooling
+import requests
+from requests.adapters import HTTPAdapter
+
+# Canonical bar schema and pipeline instrumentation
+from . import bars, instrument
+
+POLYGON_BASE_URL = 'https://api.polygon.io'
+
+# Status codes worth retrying: rate limited or a transient server error
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Polygon column names to the names used everywhere else in the bot
+COLUMN_NAMES = {'v':'Volume', 'vw':'Vwap', 'o':'Open', 'c':'Close', 'h':'High', 'l':'Low','n':'N_of_trades'}
+
+# Cache key of the grouped daily bars, which are not bars of one symbol
+GROUPED_SYMBOL = '_grouped'
+
+class TokenBucket:
+    ''' Limit calls to `rate` per `per` seconds, allowing bursts of up to `capacity` calls.
+    acquire() blocks until a token is available, so it can be shared between threads.
+    The bucket holds at least one token, so a rate below 1 call per `per` still gets calls through. '''
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        if rate <= 0:
+            raise ValueError(f'rate must be positive, not {rate}')
+        self.rate = float(rate)
+        self.per = float(per)
+        self.capacity = max(1.0, float(capacity if capacity is not None else rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Refill tokens for the time elapsed since the last call
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / self.per)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # Time until the next token is available
+                wait = (1 - self.tokens) * self.per / self.rate
+            time.sleep(wait)
+
+class PolygonClient:
+    ''' Polygon.io client sharing one pooled keep-alive session between threads.
+    If calls_per_minute is set, every request (retries included) waits on a token bucket.
+    Rate-limited (429) and server errors are retried with exponential backoff.
+    With a bar_cache.AggregateCache, aggregates are read from disk before going to the network.
+    base_url points the client at another server, e.g. the benchmark stub. '''
+
+    def __init__(self, api_key, calls_per_minute=None, pool_size=16, retries=5, backoff=0.5, timeout=30, cache=None,
+                 base_url=POLYGON_BASE_URL):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.cache = cache
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(calls_per_minute) if calls_per_minute else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, params=None, headers=None, rate_limited=True):
+        ''' GET a url, retrying with backoff. Returns the requests Response '''
+        for attempt in range(self.retries + 1):
+            if rate_limited and self.bucket is not None:
+                self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                instrument.count('http_errors', error=type(e).__name__)
+                if attempt == self.retries:
+                    raise
+                instrument.count('http_retries', reason=type(e).__name__)
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            instrument.observe('http_request', time.perf_counter() - start)
+            instrument.count('http_requests', status=response.status_code)
+            instrument.count('http_response_bytes', len(response.content))
+            if response.status_code in RETRY_STATUS and attempt < self.retries:
+                instrument.count('http_retries', reason=response.status_code)
+                # Prefer the server's Retry-After header when it sends one
+                retry_after = response.headers.get('Retry-After')
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+                time.sleep(delay)
+                continue
+            return response
+
+    def get_json(self, url, params=None):
+        ''' GET a Polygon url and return the decoded json, the api key is added if missing '''
+        params = dict(params or {})
+        if 'apiKey=' not in url:
+            params.setdefault('apiKey', self.api_key)
+        response = self.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def pages(self, url, params=None):
+        ''' Yield the decoded json of every page of a Polygon list endpoint, following next_url '''
+        data = self.get_json(url, params=params)
+        yield data
+        while data.get('next_url'):
+            data = self.get_json(data['next_url'])
+            yield data
+
+    def aggregate_pages(self, symbol, timespan, start_date, end_date, limit=50000):
+        ''' Raw aggregate results from start_date to end_date, one list per Polygon page.
+        Polygon caps a response at limit bars and links the rest with next_url '''
+        url = f'{self.base_url}/v2/aggs/ticker/{symbol}/range/1/{timespan}/{start_date}/{end_date}'
+        for data in self.pages(url, params={'adjusted':'true', 'sort':'asc', 'limit':limit}):
+            if data.get('results'):
+                yield data['results']
+
+    def aggregates(self, symbol, timespan, start_date, end_date, limit=50000):
+        ''' Aggregate bars (timespan 'minute' or 'day') from start_date to end_date as a DataFrame '''
+        if self.cache is not None:
+            cached = self.cache.get(symbol, timespan, start_date, end_date)
+            instrument.count('cache_lookups', result='miss' if cached is None else 'hit')
+            if cached is not None:
+                return aggregates_to_frame({'results': cached})
+        with instrument.stage('polygon_aggregates', timespan=timespan):
+            results = [result for page in self.aggregate_pages(symbol, timespan, start_date, end_date, limit)
+                       for result in page]
+        if self.cache is not None and results:
+            # Cache the raw results so the conversion below stays in one place
+            self.cache.put(symbol, timespan, start_date, end_date, pd.DataFrame(results))
+        return aggregates_to_frame({'results': results})
+
+    def stream_aggregates(self, symbol, timespan, start_date, end_date, limit=50000):
+        ''' Aggregate bars from start_date to end_date as one DataFrame per Polygon page, so a
+        range of months is never held in memory at once. A range already in the cache is
+        yielded as a single frame; streamed pages are not written to the cache '''
+        if self.cache is not None:
+            cached = self.cache.get(symbol, timespan, start_date, end_date)
+            if cached is not None:
+                yield aggregates_to_frame({'results': cached})
+                return
+        for page in self.aggregate_pages(symbol, timespan, start_date, end_date, limit):
+            yield aggregates_to_frame({'results': page})
+
+    def grouped_daily(self, date):
+        ''' Daily bars of every US stock on date from one grouped aggregates request, as a
+        DataFrame with a 'ticker' column. Empty on weekends and market holidays '''
+        results = self.cache.get(GROUPED_SYMBOL, 'day', date, date) if self.cache is not None else None
+        if results is None:
+            url = f'{self.base_url}/v2/aggs/grouped/locale/us/market/stocks/{date}'
+            with instrument.stage('polygon_grouped_daily'):
+                results = pd.DataFrame(self.get_json(url, params={'adjusted':'true'}).get('results') or [])
+            if self.cache is not None:
+                # Holidays are cached too so they are not asked for again, but empty bars of a
+                # trading day (not published yet) and bars fetched before the day settled expire
+                self.cache.put(GROUPED_SYMBOL, 'day', date, date, results,
+                               final=len(results) > 0 or not bars.is_trading_day(date))
+        if len(results) == 0:
+            return pd.DataFrame(columns=['ticker', 'Date', *COLUMN_NAMES.values()])
+        return aggregates_to_frame({'results': results}).rename(columns={'T':'ticker'})
+
+    def ticker_details(self, symbol, date):
+        ''' The /v3/reference/tickers results for symbol as of date '''
+        url = f'{self.base_url}/v3/reference/tickers/{symbol}'
+        return self.get_json(url, params={'date':date}).get('results')
+
+def aggregates_to_frame(data):
+    ''' Convert a Polygon aggregates json response into the bot's OHLCV DataFrame,
+    with the 'Date' column in Eastern time and the compact dtypes of bars.BAR_DTYPES.
+    A response without results (a holiday, a wrong day, a delisted ticker) gives an empty frame '''
+    if len(data.get('results', [])) == 0:
+        return bars.to_bar_schema(pd.DataFrame({**{column: [] for column in bars.BAR_DTYPES},
+                                                'Date': pd.Series(dtype='datetime64[ns]')}))
+    # Create pandas DataFrame from json data
+    df = pd.DataFrame(data['results'])
+    # Transform timestamp(ms) to datetime and convert time to Eastern Standard Time (EST)
+    df['Date'] = pd.to_datetime(df['t'], unit='ms', utc=True).dt.tz_convert(bars.EASTERN)
+    # Rename columns and drop the 't' column(timestamp)
+    df = df.rename(columns=COLUMN_NAMES).drop(columns=['t'])
+    return bars.to_bar_schema(df)
+
+def exchange_name(pre_exchange):
+    ''' Replace a primary exchange MIC with a more descriptive name '''
+    return {'XNYS':'Nyse', 'XNAS':'Nasdaq', 'XASE':'Amex'}.get(pre_exchange, pre_exchange)
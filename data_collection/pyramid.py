@@ -0,0 +1,57 @@
+''' Multi-timeframe bar pyramid.
+
+All chart timeframes of a ticker-day are built once from the 1min bars, every level
+resampled from the level below it (1min -> 5min -> 15min -> 30min -> 1h), and kept
+in an in-memory LRU so switching timeframes does not resample again. '''
+from collections import OrderedDict
+import threading
+
+# Timeframes from finest to coarsest, each one built from the previous one
+TIMEFRAMES = ['1min', '5min', '15min', '30min', '1h']
+
+# How OHLCV columns combine into a coarser bar
+resample_payload = {'Open':'first','High':'max','Low':'min','Close':'last','Volume':'sum'}
+
+def resample_level(level, timeframe):
+    ''' Resample one level to a coarser timeframe, bins closed and labelled on the left.
+    Empty bins (no trades) are dropped '''
+    coarser = level.set_index('Date')[list(resample_payload)].resample(timeframe, closed='left', label='left').agg(resample_payload)
+    return coarser.dropna(subset=['Open']).reset_index()
+
+def build_pyramid(bars_1min):
+    ''' Dict of timeframe -> bars for every timeframe in TIMEFRAMES '''
+    levels = {TIMEFRAMES[0]: bars_1min}
+    for finer, coarser in zip(TIMEFRAMES, TIMEFRAMES[1:]):
+        levels[coarser] = resample_level(levels[finer], coarser)
+    return levels
+
+class PyramidCache:
+    ''' LRU of bar pyramids keyed by (ticker, date) '''
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.pyramids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, ticker, date):
+        ''' The cached pyramid or None '''
+        with self.lock:
+            levels = self.pyramids.get((ticker, str(date)))
+            if levels is not None:
+                self.pyramids.move_to_end((ticker, str(date)))
+            return levels
+
+    def put(self, ticker, date, levels):
+        with self.lock:
+            self.pyramids[(ticker, str(date))] = levels
+            self.pyramids.move_to_end((ticker, str(date)))
+            while len(self.pyramids) > self.maxsize:
+                self.pyramids.popitem(last=False)
+
+    def levels(self, ticker, date, bars_1min):
+        ''' The pyramid of a ticker-day, built from bars_1min on a cache miss '''
+        levels = self.get(ticker, date)
+        if levels is None:
+            levels = build_pyramid(bars_1min)
+            self.put(ticker, date, levels)
+        return levels
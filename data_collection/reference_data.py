@@ -0,0 +1,179 @@
+''' Local store of ticker reference data: primary exchange, market, weighted shares
+outstanding and sector, kept in the ticker_reference table keyed by (ticker, as_of).
+
+Ingestion reads from the table first and only goes to Polygon / Yahoo on a miss,
+saving what it downloads. The refresh command loads the whole ticker universe at
+once, so the Selenium sector fallback of the menu almost never has to run.
+
+    python -m data_collection reference refresh --workers 8
+    python -m data_collection reference refresh --tickers tickers.csv --no-sector
+'''
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date as datetime_date
+
+# Data analysis and manipulation
+import pandas as pd
+
+# HTTP errors of the yahoo profile request
+import requests
+
+# Database management
+from sqlalchemy import text
+
+# ANSI color formatting
+from termcolor import colored
+
+from . import config, instrument, store
+
+YAHOO_BASE_URL = 'https://finance.yahoo.com'
+YAHOO_HEADERS = {'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/103.0.0.0 Safari/537.36'}
+
+REFERENCE_COLUMNS = ['ticker','as_of','primary_exchange','market','weighted_shares_outstanding','sector']
+
+def lookup_details(cnx, ticker, date, max_age_days=None):
+    ''' Stored details closest to date as a dict shaped like Polygon's ticker details
+    results, or None if there is none within max_age_days (REFERENCE_MAX_AGE_DAYS of sql_config) '''
+    if max_age_days is None:
+        max_age_days = config.get('REFERENCE_MAX_AGE_DAYS', 30)
+    query = text('''SELECT primary_exchange, market, weighted_shares_outstanding FROM ticker_reference
+                    WHERE ticker = :ticker AND weighted_shares_outstanding IS NOT NULL
+                      AND abs(as_of - CAST(:date AS date)) <= :max_age
+                    ORDER BY abs(as_of - CAST(:date AS date)) LIMIT 1''')
+    with cnx.connect() as conn:
+        row = conn.execute(query, {'ticker': ticker, 'date': str(date), 'max_age': max_age_days}).mappings().first()
+    return dict(row) if row is not None else None
+
+def lookup_sector(cnx, ticker):
+    ''' Most recent stored sector of ticker, or None '''
+    query = text('''SELECT sector FROM ticker_reference WHERE ticker = :ticker AND sector IS NOT NULL
+                    ORDER BY as_of DESC LIMIT 1''')
+    with cnx.connect() as conn:
+        return conn.execute(query, {'ticker': ticker}).scalar()
+
+def save(cnx, rows):
+    ''' Upsert reference rows (dicts with any of REFERENCE_COLUMNS besides ticker and as_of).
+    A missing value never overwrites a stored one '''
+    rows = [{column: row.get(column) for column in REFERENCE_COLUMNS} for row in rows]
+    if not rows:
+        return
+    updates = ', '.join(f'{c} = COALESCE(EXCLUDED.{c}, ticker_reference.{c})' for c in REFERENCE_COLUMNS[2:])
+    statement = text(f'''INSERT INTO ticker_reference ({', '.join(REFERENCE_COLUMNS)})
+                         VALUES ({', '.join(':' + c for c in REFERENCE_COLUMNS)})
+                         ON CONFLICT (ticker, as_of) DO UPDATE SET {updates}''')
+    with cnx.begin() as conn:
+        conn.execute(statement, rows)
+
+@instrument.timed('sector_yahoo')
+def yahoo_sector(client, ticker):
+    ''' Scrape the sector from the yahoo profile page. Raises ValueError when the page
+    can't be downloaded (after the client's retries) or has no sector '''
+    from bs4 import BeautifulSoup
+    url_profile = f'{YAHOO_BASE_URL}/quote/{ticker}/profile?p={ticker}'
+    try:
+        response = client.get(url_profile, headers=YAHOO_HEADERS, rate_limited=False)
+    except requests.RequestException as e:
+        raise ValueError(f'sector of {ticker} is unavailable, yahoo request failed: {e}') from e
+    soup = BeautifulSoup(response.text, 'html.parser')
+    sector = [span.contents[0] for span in soup.find_all('span',{'class':'Fw(600)'}) if span.contents]
+    if len(sector) < 2:
+        raise ValueError(f'sector of {ticker} is unavailable, yahoo profile page has none (HTTP {response.status_code})')
+    return str(sector[1])
+
+def ticker_details(cnx, client, ticker, date):
+    ''' Exchange and shares outstanding of ticker on date, from the store or else from Polygon.
+    cnx may be None to skip the store '''
+    if cnx is not None:
+        details = lookup_details(cnx, ticker, date)
+        instrument.count('reference_lookups', kind='details', result='miss' if details is None else 'hit')
+        if details is not None:
+            return details
+    with instrument.stage('polygon_ticker_details'):
+        results = client.ticker_details(ticker, date) or {}
+    if cnx is not None:
+        save(cnx, [{'ticker': ticker, 'as_of': str(date), **results}])
+    return results
+
+def sector(cnx, client, ticker):
+    ''' Sector of ticker from the store or else from Yahoo, raises ValueError if Yahoo has none '''
+    if cnx is not None:
+        stored = lookup_sector(cnx, ticker)
+        instrument.count('reference_lookups', kind='sector', result='miss' if stored is None else 'hit')
+        if stored is not None:
+            return stored
+    final_sector = yahoo_sector(client, ticker)
+    save_sector(cnx, ticker, final_sector)
+    return final_sector
+
+def save_sector(cnx, ticker, final_sector):
+    ''' Remember a sector found by any method (e.g. the Selenium fallback) '''
+    if cnx is not None:
+        save(cnx, [{'ticker': ticker, 'as_of': str(datetime_date.today()), 'sector': final_sector}])
+
+def ticker_universe(client, market='stocks'):
+    ''' Every active ticker of the market, following Polygon's next_url pages '''
+    tickers = []
+    for data in client.pages(f'{client.base_url}/v3/reference/tickers',
+                             params={'market': market, 'active': 'true', 'limit': 1000}):
+        tickers.extend(result['ticker'] for result in data.get('results', []))
+    return tickers
+
+def refresh_ticker(client, ticker, as_of, with_sector=True):
+    ''' Download the reference row of one ticker '''
+    row = {'ticker': ticker, 'as_of': as_of, **(client.ticker_details(ticker, as_of) or {})}
+    if with_sector:
+        try:
+            row['sector'] = yahoo_sector(client, ticker)
+        except Exception:
+            # Some tickers (funds, warrants, OTC) have no yahoo profile
+            pass
+    return row
+
+def refresh(cnx, client, tickers, as_of, workers=8, with_sector=True, batch_size=500):
+    ''' Download and store the reference data of every ticker concurrently, saved in batches.
+    Returns the list of tickers that failed '''
+    batch, failed = [], []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(refresh_ticker, client, ticker, as_of, with_sector): ticker for ticker in tickers}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                batch.append(future.result())
+            except Exception as e:
+                failed.append(futures[future])
+                print(colored(f'{futures[future]} failed: {e}', 'red'))
+            if len(batch) >= batch_size or done == len(futures):
+                save(cnx, batch)
+                batch = []
+                print(f'[{done}/{len(futures)}] reference rows saved')
+    return failed
+
+def add_arguments(parser):
+    subparsers = parser.add_subparsers(dest='reference_command', required=True)
+    refresh_parser = subparsers.add_parser('refresh', help='load reference data for the whole ticker universe')
+    refresh_parser.add_argument('--tickers', help='csv with a ticker column, defaults to every active Polygon stock')
+    refresh_parser.add_argument('--as-of', default=str(datetime_date.today()), help='as-of date of the details')
+    refresh_parser.add_argument('--workers', type=int, default=8, help='concurrent downloads')
+    refresh_parser.add_argument('--calls-per-minute', type=float,
+                                help='Polygon rate limit, defaults to POLYGON_CALLS_PER_MINUTE in sql_config')
+    refresh_parser.add_argument('--no-sector', action='store_true', help='skip the yahoo sector scrape')
+
+def run(args):
+    from .fetch import client_from_config
+    client = client_from_config(pool_size=args.workers, calls_per_minute=args.calls_per_minute)
+    cnx = store.engine_from_config()
+    if args.tickers:
+        tickers = pd.read_csv(args.tickers, dtype={'ticker': str})['ticker'].str.strip().str.upper().unique().tolist()
+    else:
+        tickers = ticker_universe(client)
+    failed = refresh(cnx, client, tickers, args.as_of, workers=args.workers, with_sector=not args.no_sector)
+    print(colored(f'{len(tickers) - len(failed)} of {len(tickers)} tickers refreshed', 'cyan'))
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local ticker reference data')
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    sys.exit(main())
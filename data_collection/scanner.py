@@ -0,0 +1,172 @@
+''' In-database scanner over the stored 1min bars.
+
+The breakout_metrics materialized view (create_table.sql) computes the 5mins high,
+HOD time, breakout time and volume before breakout of every (ticker, date) in
+one_min_data with window functions, so re-running the stats for the whole history is
+one query instead of downloading every day again. apply() copies the view into
+primary_sheet, whose generated columns (entry_on_bo_gain, ...) follow on their own.
+redefine() applies edited generated column definitions of create_table.sql to an
+existing primary_sheet.
+
+    python -m data_collection scan refresh
+    python -m data_collection scan apply
+    python -m data_collection scan show --ticker AAPL --start 2023-01-01 --output metrics.csv
+    python -m data_collection scan redefine
+'''
+import argparse
+import os
+import re
+import sys
+
+# Data analysis and manipulation
+import pandas as pd
+
+# Database management
+from sqlalchemy import text
+
+# ANSI color formatting
+from termcolor import colored
+
+from . import instrument, store
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'create_table.sql')
+
+# ALTER TABLE primary_sheet ADD COLUMN name TYPE GENERATED ALWAYS AS (expression) STORED;
+GENERATED_COLUMN = re.compile(r'ALTER TABLE primary_sheet ADD COLUMN (\w+) (\w+) GENERATED ALWAYS AS \((.*)\) STORED;')
+
+@instrument.timed('scan_refresh')
+def refresh(cnx, concurrently=True):
+    ''' Recompute breakout_metrics from one_min_data. CONCURRENTLY keeps the view readable
+    meanwhile, through the unique index create_table.sql builds with the populated view '''
+    with cnx.begin() as conn:
+        conn.execute(text(f'REFRESH MATERIALIZED VIEW {"CONCURRENTLY " if concurrently else ""}breakout_metrics'))
+
+def filters(ticker=None, start_date=None, end_date=None, alias=''):
+    ''' WHERE conditions and params restricting rows to one ticker and a date range '''
+    conditions, params = [], {}
+    if ticker is not None:
+        conditions.append(f'{alias}ticker = :ticker')
+        params['ticker'] = ticker
+    if start_date is not None:
+        conditions.append(f'{alias}date >= :start')
+        params['start'] = str(start_date)
+    if end_date is not None:
+        conditions.append(f'{alias}date <= :end')
+        params['end'] = str(end_date)
+    return conditions, params
+
+def breakout_metrics(cnx, ticker=None, start_date=None, end_date=None):
+    ''' Rows of breakout_metrics, optionally for one ticker and a date range '''
+    conditions, params = filters(ticker, start_date, end_date)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    query = text(f'SELECT ticker, date, five_mins_high, hod, breakout, vol_b4_bo FROM breakout_metrics {where} '
+                 'ORDER BY date, ticker')
+    return pd.read_sql(query, con=cnx, params=params)
+
+# primary_sheet columns as computed by the view, in the text / rounding of the ingestion path
+APPLIED_COLUMNS = '''round(m.five_mins_high::numeric, 4)::float8 AS five_mins_high,
+                     to_char(m.hod, 'HH24:MI:SS') AS hod,
+                     m.vol_b4_bo AS vol_b4_bo'''
+
+def mismatches(cnx, ticker=None, start_date=None, end_date=None):
+    ''' primary_sheet rows whose stored metrics differ from breakout_metrics, optionally
+    for one ticker and a date range '''
+    conditions, params = filters(ticker, start_date, end_date, alias='p.')
+    conditions.insert(0, '(p.five_mins_high, p.hod, p.vol_b4_bo) IS DISTINCT FROM (v.five_mins_high, v.hod, v.vol_b4_bo)')
+    query = text(f'''SELECT p.id, p.ticker, p.date,
+                            p.five_mins_high AS stored_five_mins_high, p.hod AS stored_hod,
+                            p.vol_b4_bo AS stored_vol_b4_bo, v.five_mins_high, v.hod, v.vol_b4_bo
+                     FROM primary_sheet p
+                     JOIN (SELECT m.ticker, m.date, {APPLIED_COLUMNS} FROM breakout_metrics m) v
+                       ON v.ticker = p.ticker AND v.date = p.date
+                     WHERE {" AND ".join(conditions)}
+                     ORDER BY p.date, p.ticker''')
+    return pd.read_sql(query, con=cnx, params=params)
+
+@instrument.timed('scan_apply')
+def apply(cnx):
+    ''' Copy breakout_metrics into the primary_sheet rows that differ, in one UPDATE.
+    Generated columns depending on them are recomputed by Postgres. Returns the rows updated '''
+    query = text(f'''UPDATE primary_sheet p
+                     SET five_mins_high = v.five_mins_high, hod = v.hod, vol_b4_bo = v.vol_b4_bo
+                     FROM (SELECT m.ticker, m.date, {APPLIED_COLUMNS} FROM breakout_metrics m
+                           WHERE m.five_mins_high IS NOT NULL AND m.hod IS NOT NULL) v
+                     WHERE v.ticker = p.ticker AND v.date = p.date
+                       AND (p.five_mins_high, p.hod, p.vol_b4_bo) IS DISTINCT FROM (v.five_mins_high, v.hod, v.vol_b4_bo)''')
+    with cnx.begin() as conn:
+        updated = conn.execute(query).rowcount
+    instrument.count('rows_written', updated, table='primary_sheet')
+    return updated
+
+def schema_generated_columns(path=SCHEMA_PATH):
+    ''' {column: (type, expression)} of the generated primary_sheet columns in create_table.sql '''
+    with open(path) as f:
+        return {name: (column_type, expression) for name, column_type, expression in GENERATED_COLUMN.findall(f.read())}
+
+def redefine_statement(columns):
+    ''' One ALTER TABLE dropping and re-adding the generated columns, so primary_sheet is
+    rewritten once whatever the number of columns '''
+    actions = []
+    for name, (column_type, expression) in columns.items():
+        actions.append(f'DROP COLUMN IF EXISTS {name}')
+        actions.append(f'ADD COLUMN {name} {column_type} GENERATED ALWAYS AS ({expression}) STORED')
+    return f'ALTER TABLE primary_sheet {", ".join(actions)}'
+
+@instrument.timed('scan_redefine')
+def redefine(cnx, columns=None):
+    ''' Recreate generated primary_sheet columns (by default every one in create_table.sql) with
+    their current definitions, which recomputes them for every row '''
+    columns = columns if columns is not None else schema_generated_columns()
+    with cnx.begin() as conn:
+        conn.execute(text(redefine_statement(columns)))
+    return list(columns)
+
+def add_arguments(parser):
+    subparsers = parser.add_subparsers(dest='scan_command', required=True)
+    refresh_parser = subparsers.add_parser('refresh', help='recompute breakout_metrics from one_min_data')
+    refresh_parser.add_argument('--blocking', action='store_true',
+                                help='plain REFRESH, which blocks reads of the view while it runs')
+    subparsers.add_parser('apply', help='copy breakout_metrics into primary_sheet where they differ')
+    show_parser = subparsers.add_parser('show', help='print or save breakout_metrics')
+    show_parser.add_argument('--ticker', type=str.upper)
+    show_parser.add_argument('--start', help='first date, YYYY-MM-DD')
+    show_parser.add_argument('--end', help='last date, YYYY-MM-DD')
+    show_parser.add_argument('--mismatches', action='store_true', help='only primary_sheet rows that differ')
+    show_parser.add_argument('--output', help='write the rows to this csv')
+    redefine_parser = subparsers.add_parser('redefine', help='apply the generated column definitions of create_table.sql')
+    redefine_parser.add_argument('columns', nargs='*', help='columns to recreate, all by default')
+
+def run(args):
+    cnx = store.engine_from_config()
+    if args.scan_command == 'refresh':
+        refresh(cnx, concurrently=not args.blocking)
+        print(colored('breakout_metrics refreshed', 'cyan'))
+    elif args.scan_command == 'apply':
+        print(colored(f'{apply(cnx)} primary_sheet rows updated', 'cyan'))
+    elif args.scan_command == 'show':
+        if args.mismatches:
+            rows = mismatches(cnx, args.ticker, args.start, args.end)
+        else:
+            rows = breakout_metrics(cnx, args.ticker, args.start, args.end)
+        if args.output:
+            rows.to_csv(args.output, index=False)
+            print(f'{len(rows)} rows written to {args.output}')
+        else:
+            print(rows.to_string(index=False))
+    elif args.scan_command == 'redefine':
+        columns = schema_generated_columns()
+        if args.columns:
+            unknown = set(args.columns) - set(columns)
+            if unknown:
+                raise SystemExit(f'not generated columns in create_table.sql: {", ".join(sorted(unknown))}')
+            columns = {name: columns[name] for name in args.columns}
+        print(colored(f'Recomputed {", ".join(redefine(cnx, columns))}', 'cyan'))
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Breakout metrics of the stored 1min bars, computed in Postgres')
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    sys.exit(main())
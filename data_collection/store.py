@@ -0,0 +1,266 @@
+# In-memory csv buffer for COPY
+import io
+import os
+import threading
+
+# Data analysis and manipulation
+import pandas as pd
+
+# Database management
+from sqlalchemy import create_engine, text
+
+# Canonical bar schema and multi-timeframe pyramid
+from . import bars, config, instrument, pyramid
+
+# What to do when a (ticker, date) is already in primary_sheet
+ON_CONFLICT = ('skip', 'overwrite')
+
+# Column order of one_min_data
+ONE_MIN_COLUMNS = ['stock_one_min_id','ticker','date','open','high','low','close','volume','vwap','n_of_trades']
+
+# Tables of the bar pyramid levels above 1min (see pyramid.py) and their columns
+AGGREGATE_TABLES = {'5min':'five_min_data', '15min':'fifteen_min_data', '30min':'thirty_min_data', '1h':'one_hour_data'}
+AGGREGATE_COLUMNS = ['stock_one_min_id','ticker','date','open','high','low','close','volume']
+
+# Database columns back to the bot's column names
+BAR_COLUMN_NAMES = {'date':'Date', 'open':'Open', 'high':'High', 'low':'Low', 'close':'Close',
+                    'volume':'Volume', 'vwap':'Vwap', 'n_of_trades':'N_of_trades'}
+
+# One pooled engine per process and pool size, shared by every caller and thread
+_engines = {}
+_engines_lock = threading.Lock()
+
+def engine_from_config(pool_size=None):
+    ''' The SQLAlchemy engine of the Postgres login information in sql_config. Engines are
+    shared within a process (a forked worker gets its own), with pool_size connections
+    (DB_POOL_SIZE in sql_config, 5 by default) checked before use '''
+    sql_config = config.load()
+    pool_size = pool_size or config.get('DB_POOL_SIZE', 5)
+    key = (os.getpid(), pool_size)
+    with _engines_lock:
+        if key not in _engines:
+            postgres_str = (f'postgresql://{sql_config.USERNAME}:{sql_config.PASSWORD}'
+                            f'@{sql_config.IPADDRESS}:{sql_config.PORT}/{sql_config.DB_NAME}')
+            _engines[key] = create_engine(postgres_str, pool_size=pool_size, max_overflow=pool_size,
+                                          pool_pre_ping=True)
+        return _engines[key]
+
+def is_stored(cnx, ticker, date):
+    ''' True if (ticker, date) is in primary_sheet, an index lookup on the unique constraint '''
+    query = text('SELECT EXISTS (SELECT 1 FROM primary_sheet WHERE ticker = :ticker AND date = :date)')
+    with instrument.stage('duplicate_check'), cnx.connect() as conn:
+        return bool(conn.execute(query, {'ticker': ticker, 'date': date}).scalar())
+
+def stored_ticker_dates(cnx, tickers, dates):
+    ''' Set of the given (ticker, 'YYYY-MM-DD') pairs that are already in primary_sheet.
+    Only the requested pairs are looked up, not the whole table '''
+    query = text('''SELECT p.ticker, p.date FROM primary_sheet p
+                    JOIN unnest(CAST(:tickers AS text[]), CAST(:dates AS date[])) AS j(ticker, date)
+                    ON p.ticker = j.ticker AND p.date = j.date''')
+    with cnx.connect() as conn:
+        rows = conn.execute(query, {'tickers': list(tickers), 'dates': list(dates)}).fetchall()
+    return {(ticker, str(date)) for ticker, date in rows}
+
+def upsert_statement(columns, on_conflict):
+    ''' INSERT INTO primary_sheet ... ON CONFLICT (ticker, date) returning the row id, which
+    Postgres assigns from the id sequence so concurrent writers never collide.
+    'skip' returns nothing for an existing row, 'overwrite' updates it in place and keeps its id '''
+    if on_conflict not in ON_CONFLICT:
+        raise ValueError(f'on_conflict must be one of {ON_CONFLICT}, not {on_conflict!r}')
+    if on_conflict == 'skip':
+        action = 'DO NOTHING'
+    else:
+        updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in columns if c not in ('id', 'ticker', 'date'))
+        action = f'DO UPDATE SET {updates}'
+    return text(f'''INSERT INTO primary_sheet ({', '.join(columns)})
+                    VALUES ({', '.join(':' + c for c in columns)})
+                    ON CONFLICT (ticker, date) {action} RETURNING id''')
+
+def store_ticker_day(cnx, df, df_plot, ticker, on_conflict='skip', levels=None):
+    ''' Store one primary_sheet row (df), its 1min bars (df_plot) and their bar pyramid
+    (levels, built from df_plot if not given) in one transaction.
+    Returns the row id, or None if the ticker-day was already stored and on_conflict is 'skip' '''
+    return store_ticker_days(cnx, [(df, df_plot, ticker, levels)], on_conflict)[0]
+
+def store_ticker_days(cnx, ticker_days, on_conflict='skip'):
+    ''' Store many (df, df_plot, ticker, levels) ticker-days in one transaction: every
+    primary_sheet row is inserted with RETURNING id, then the bars of the whole batch go in
+    with one COPY per table. Either everything is stored or nothing is.
+    Returns the row ids, None for a ticker-day already stored when on_conflict is 'skip' '''
+    primary_keys, one_min_frames, aggregate_frames = [], [], {table: [] for table in AGGREGATE_TABLES.values()}
+    for _, df_plot, _, _ in ticker_days:
+        ensure_partitions(cnx, bars.wall_clock(df_plot['Date']))
+    with instrument.stage('store'), cnx.begin() as conn:
+        for df, df_plot, ticker, levels in ticker_days:
+            # Store data to SQL table "primary_sheet", the id comes from its sequence
+            df = df.drop(columns=['id'], errors='ignore')
+            primary_key = conn.execute(upsert_statement(list(df.columns), on_conflict),
+                                       df.to_dict('records')[0]).scalar()
+            primary_keys.append(primary_key)
+            if primary_key is None:
+                instrument.count('rows_skipped', table='primary_sheet')
+                continue
+            instrument.count('rows_written', table='primary_sheet')
+            # Bars already stored for the ticker-day, by an overwritten row or by a streamed or
+            # live load (NULL stock_one_min_id), are replaced whatever on_conflict is
+            dates = bars.wall_clock(df_plot['Date'])
+            bounds = {'ticker': ticker, 'first': dates.min().normalize(),
+                      'end': dates.max().normalize() + pd.Timedelta(days=1)}
+            for table in ['one_min_data', *AGGREGATE_TABLES.values()]:
+                conn.execute(text(f'DELETE FROM {table} WHERE ticker = :ticker AND date >= :first AND date < :end'),
+                             bounds)
+
+            # 1min data for SQL table "one_min_data"
+            df_foreign_table = df_plot.copy()
+            df_foreign_table.columns = df_foreign_table.columns.str.lower()
+            df_foreign_table['ticker'], df_foreign_table['stock_one_min_id'] = f'{ticker}', primary_key
+            one_min_frames.append(df_foreign_table)
+
+            # The 5min to 1h bars next to it
+            levels = levels if levels is not None else pyramid.build_pyramid(df_plot)
+            for table, frame in aggregate_tables(levels, ticker, primary_key).items():
+                aggregate_frames[table].append(frame)
+
+        if one_min_frames:
+            copy_one_min_data(conn, pd.concat(one_min_frames, ignore_index=True))
+            copy_aggregates(conn, {table: pd.concat(frames, ignore_index=True)
+                                   for table, frames in aggregate_frames.items()})
+    return primary_keys
+
+# Monthly one_min_data partitions this process has seen, so their DDL is not run again
+_partitions = set()
+_partitions_lock = threading.Lock()
+
+def ensure_partitions(cnx, dates):
+    ''' Create the monthly one_min_data partitions covering dates if they do not exist yet.
+    Runs in a short transaction of its own, before the bars are written: creating a partition
+    locks one_min_data and primary_sheet, which inside concurrent write transactions deadlocks '''
+    months = [month for month in pd.to_datetime(pd.Series(dates)).dt.tz_localize(None).dt.to_period('M').unique()
+              if month not in _partitions]
+    if not months:
+        return
+    with cnx.begin() as conn:
+        # One creator at a time across processes
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('one_min_data partitions'))"))
+        for month in months:
+            start = month.start_time.date()
+            end = (month + 1).start_time.date()
+            conn.execute(text(f'''CREATE TABLE IF NOT EXISTS one_min_data_{month.year}_{month.month:02d}
+                                 PARTITION OF one_min_data FOR VALUES FROM ('{start}') TO ('{end}')'''))
+    with _partitions_lock:
+        _partitions.update(months)
+
+def copy_csv(cursor, table, columns, frame):
+    ''' COPY the columns of one frame into table through a csv buffer '''
+    buffer = io.StringIO()
+    frame[columns].to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY {table} ({",".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+    instrument.count('rows_written', len(frame), table=table)
+
+def copy_one_min_data(conn, frames):
+    ''' Stream one or more one_min_data frames into Postgres with COPY FROM STDIN.
+    conn is a SQLAlchemy Connection inside a transaction, so the load commits or rolls back with it.
+    The partitions of the bars must exist, see ensure_partitions '''
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    cursor = conn.connection.cursor()
+    rows = 0
+    try:
+        for frame in frames:
+            if len(frame) == 0:
+                continue
+            frame = frame[ONE_MIN_COLUMNS].copy()
+            # one_min_data stores Eastern wall-clock time without a time zone
+            frame['date'] = bars.wall_clock(pd.to_datetime(frame['date']))
+            # COPY will not cast 12.0 into an integer column
+            frame['volume'] = frame['volume'].round().astype('int64')
+            frame['n_of_trades'] = frame['n_of_trades'].round().astype('Int32')
+            copy_csv(cursor, 'one_min_data', ONE_MIN_COLUMNS, frame)
+            rows += len(frame)
+    finally:
+        cursor.close()
+    return rows
+
+def load_one_min_data(cnx, frames):
+    ''' Bulk load frames of 1min bars (already carrying stock_one_min_id and ticker) in one transaction '''
+    frames = [frames] if isinstance(frames, pd.DataFrame) else list(frames)
+    for frame in frames:
+        ensure_partitions(cnx, bars.wall_clock(pd.to_datetime(frame['date'])))
+    with cnx.begin() as conn:
+        return copy_one_min_data(conn, frames)
+
+def primary_keys(conn, ticker, start_date, end_date):
+    ''' {date: primary_sheet id} of the ticker-days stored between start_date and end_date '''
+    query = text('SELECT date, id FROM primary_sheet WHERE ticker = :ticker AND date BETWEEN :start AND :end')
+    rows = conn.execute(query, {'ticker': ticker, 'start': str(start_date), 'end': str(end_date)}).fetchall()
+    return {pd.Timestamp(date): primary_key for date, primary_key in rows}
+
+def stream_one_min_data(cnx, ticker, frames, start_date, end_date):
+    ''' Load a stream of 1min bar frames of one ticker (e.g. PolygonClient.stream_aggregates pages),
+    committing page by page so memory stays bounded and an interrupted load keeps what it wrote.
+    Bars of days in primary_sheet are linked to their row, other days get a NULL stock_one_min_id.
+    Rows already stored between the first and last bar of a page are replaced, so a range can be
+    loaded again. Returns the number of rows loaded '''
+    with cnx.connect() as conn:
+        day_ids = primary_keys(conn, ticker, start_date, end_date)
+    return sum(replace_one_min_data(cnx, ticker, frame, day_ids) for frame in frames)
+
+def replace_one_min_data(cnx, ticker, frame, day_ids, stage='store_page'):
+    ''' Replace the stored 1min bars of ticker between the first and last bar of frame with
+    frame, in one transaction. day_ids is {date: primary_sheet id} (see primary_keys) '''
+    if len(frame) == 0:
+        return 0
+    frame = frame.copy()
+    frame.columns = frame.columns.str.lower()
+    frame['ticker'] = ticker
+    days = bars.wall_clock(frame['date']).dt.normalize()
+    frame['stock_one_min_id'] = days.map(day_ids).astype('Int64')
+    first, last = bars.wall_clock(frame['date'].iloc[[0, -1]])
+    ensure_partitions(cnx, [first, last])
+    with instrument.stage(stage), cnx.begin() as conn:
+        conn.execute(text('DELETE FROM one_min_data WHERE ticker = :ticker AND date BETWEEN :first AND :last'),
+                     {'ticker': ticker, 'first': first, 'last': last})
+        return copy_one_min_data(conn, frame)
+
+def aggregate_tables(levels, ticker, primary_key):
+    ''' {table: frame} of the 5min to 1h levels of a bar pyramid, in the aggregate table columns '''
+    frames = {}
+    for timeframe, table in AGGREGATE_TABLES.items():
+        frame = levels[timeframe].copy()
+        frame.columns = frame.columns.str.lower()
+        frame['date'] = bars.wall_clock(frame['date'])
+        frame['ticker'], frame['stock_one_min_id'] = ticker, primary_key
+        frames[table] = frame
+    return frames
+
+def copy_aggregates(conn, frames):
+    ''' COPY {table: frame} (see aggregate_tables) into the aggregate tables '''
+    cursor = conn.connection.cursor()
+    try:
+        for table, frame in frames.items():
+            copy_csv(cursor, table, AGGREGATE_COLUMNS, frame)
+    finally:
+        cursor.close()
+
+def read_bars(cnx, table, columns, ticker, date):
+    ''' Bars of one ticker-day from a bar table in the bars.py schema '''
+    query = text(f'''SELECT {', '.join(columns)} FROM {table}
+                     WHERE ticker = :ticker AND date >= CAST(:day AS date) AND date < CAST(:day AS date) + 1
+                     ORDER BY date''')
+    frame = pd.read_sql(query, con=cnx, params={'ticker': ticker, 'day': str(date)})
+    frame.columns = [BAR_COLUMN_NAMES[c] for c in frame.columns]
+    return bars.to_bar_schema(frame)
+
+def read_pyramid(cnx, ticker, date):
+    ''' The stored bar pyramid of a ticker-day, None if its 1min bars are not stored.
+    Levels missing from the aggregate tables are rebuilt from the 1min bars '''
+    bars_1min = read_bars(cnx, 'one_min_data', ONE_MIN_COLUMNS[2:], ticker, date)
+    if len(bars_1min) == 0:
+        return None
+    levels = {'1min': bars_1min}
+    for timeframe, table in AGGREGATE_TABLES.items():
+        levels[timeframe] = read_bars(cnx, table, AGGREGATE_COLUMNS[2:], ticker, date)
+    if any(len(levels[timeframe]) == 0 for timeframe in AGGREGATE_TABLES):
+        levels = pyramid.build_pyramid(bars_1min)
+    return levels
@@ -0,0 +1,61 @@
+''' Fills of backtest.simulate on hand-made ticker-days. Run with python -m pytest '''
+import numpy as np
+import pandas as pd
+import pytest
+
+from .backtest import Panel, simulate
+
+# 9:30-9:34 opening range with a 10.0 high
+OPENING = [(9.5, 10.0, 9.4, 9.8)] * 5
+
+def panel_of(candles, ticker='AAA', day='2023-03-03'):
+    ''' Panel of one ticker-day from (open, high, low, close) candles from 9:30 on '''
+    open_, high, low, close = np.array(candles, dtype='float64').T
+    dates = pd.date_range(f'{day} 09:30', periods=len(candles), freq='min')
+    return Panel.from_bars(pd.DataFrame({'ticker': ticker, 'date': dates, 'open': open_, 'high': high,
+                                         'low': low, 'close': close, 'volume': 100}))
+
+def trade(candles, **params):
+    result = simulate(panel_of(candles), **params)
+    return {key: value[0] for key, value in result.items()}
+
+def test_entry_at_the_range_high():
+    result = trade(OPENING + [(9.9, 10.5, 9.9, 10.3), (10.3, 10.4, 10.2, 10.35)], stop=0.05)
+    assert result['entered'] and result['entry_column'] == 5
+    assert result['entry_price'] == pytest.approx(10.0)
+    # Neither stop nor target, out at the close of the last candle
+    assert result['exit_reason'] == 'time'
+    assert result['exit_price'] == pytest.approx(10.35)
+
+def test_gap_down_stop_fills_at_the_open():
+    # Stop at 9.5, the next candle opens at 9.0 below it
+    result = trade(OPENING + [(9.9, 10.5, 9.9, 10.3), (9.0, 9.2, 8.9, 9.1)], stop=0.05)
+    assert result['exit_reason'] == 'stop' and result['exit_column'] == 6
+    assert result['exit_price'] == pytest.approx(9.0)
+    assert result['return'] == pytest.approx(-0.1)
+
+def test_stop_fills_at_the_stop_price():
+    result = trade(OPENING + [(9.9, 10.5, 9.9, 10.3), (10.0, 10.1, 9.3, 9.4)], stop=0.05)
+    assert result['exit_reason'] == 'stop'
+    assert result['exit_price'] == pytest.approx(9.5)
+
+def test_target_fills_at_the_target_price():
+    # Target at 11.0, reached inside a candle opening below it
+    result = trade(OPENING + [(9.9, 10.5, 9.9, 10.3), (10.2, 11.5, 10.1, 11.2)], stop=0.05, target=0.1)
+    assert result['exit_reason'] == 'target'
+    assert result['exit_price'] == pytest.approx(11.0)
+    assert result['return'] == pytest.approx(0.1)
+
+def test_gap_up_target_fills_at_the_open():
+    result = trade(OPENING + [(9.9, 10.5, 9.9, 10.3), (11.4, 11.6, 11.3, 11.5)], stop=0.05, target=0.1)
+    assert result['exit_reason'] == 'target'
+    assert result['exit_price'] == pytest.approx(11.4)
+
+def test_stop_wins_over_target_on_the_same_candle():
+    result = trade(OPENING + [(9.9, 10.5, 9.9, 10.3), (10.2, 11.5, 9.0, 10.0)], stop=0.05, target=0.1)
+    assert result['exit_reason'] == 'stop'
+    assert result['exit_price'] == pytest.approx(9.5)
+
+def test_no_entry_below_the_range_high():
+    result = trade(OPENING + [(9.8, 9.9, 9.7, 9.8)] * 3)
+    assert not result['entered'] and np.isnan(result['return'])
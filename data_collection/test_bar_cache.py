@@ -0,0 +1,64 @@
+''' Expiry and eviction of AggregateCache entries under a fake clock. Run with python -m pytest '''
+import pandas as pd
+import pytest
+
+from .bar_cache import AggregateCache
+
+DAY = '2023-03-03'
+
+class Clock:
+    ''' Settable epoch seconds in place of time.time '''
+    def __init__(self, when):
+        self.now = pd.Timestamp(when, tz='US/Eastern').timestamp()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def results():
+    return pd.DataFrame({'t': [1677853800000], 'o': [10.0], 'h': [10.5], 'l': [9.9], 'c': [10.2], 'v': [100]})
+
+def test_in_session_entry_expires_after_ttl(tmp_path, results):
+    clock = Clock(f'{DAY} 12:00')
+    cache = AggregateCache(str(tmp_path), ttl=60, settle=3600, clock=clock)
+    cache.put('AAA', 'minute', DAY, DAY, results)
+    clock.advance(30)
+    pd.testing.assert_frame_equal(cache.get('AAA', 'minute', DAY, DAY), results)
+    clock.advance(31)
+    assert cache.get('AAA', 'minute', DAY, DAY) is None
+    # Still a miss once the session settled, the file holds bars from the middle of the day
+    clock.advance(24 * 3600)
+    assert cache.get('AAA', 'minute', DAY, DAY) is None
+
+def test_entry_fetched_after_settle_stays_a_hit(tmp_path, results):
+    # The extended session ends at 20:00, settled an hour later
+    clock = Clock(f'{DAY} 21:00')
+    cache = AggregateCache(str(tmp_path), ttl=60, settle=3600, clock=clock)
+    cache.put('AAA', 'minute', DAY, DAY, results)
+    clock.advance(365 * 24 * 3600)
+    pd.testing.assert_frame_equal(cache.get('AAA', 'minute', DAY, DAY), results)
+
+def test_not_final_entry_expires_after_settle(tmp_path, results):
+    clock = Clock(f'{DAY} 21:00')
+    cache = AggregateCache(str(tmp_path), ttl=60, settle=3600, clock=clock)
+    cache.put('AAA', 'minute', DAY, DAY, results, final=False)
+    assert cache.get('AAA', 'minute', DAY, DAY) is not None
+    clock.advance(61)
+    assert cache.get('AAA', 'minute', DAY, DAY) is None
+
+def test_evicts_least_recently_used(tmp_path, results):
+    clock = Clock('2023-03-10 12:00')
+    cache = AggregateCache(str(tmp_path), clock=clock)
+    for ticker in ['AAA', 'BBB', 'CCC']:
+        cache.put(ticker, 'minute', DAY, DAY, results)
+        clock.advance(10)
+    # AAA read last, BBB is now the least recently used
+    assert cache.get('AAA', 'minute', DAY, DAY) is not None
+    cache.max_bytes = 2 * (tmp_path / 'AAA' / 'minute' / f'{DAY}_{DAY}.parquet').stat().st_size
+    cache.evict()
+    assert cache.get('BBB', 'minute', DAY, DAY) is None
+    assert cache.get('AAA', 'minute', DAY, DAY) is not None
+    assert cache.get('CCC', 'minute', DAY, DAY) is not None
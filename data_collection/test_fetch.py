@@ -0,0 +1,51 @@
+''' The primary_sheet breakout inputs of fetch on days without a breakout level.
+Run with python -m pytest '''
+import pandas as pd
+import pytest
+
+from . import bars
+from .fetch import breakout_inputs, daily_inputs, fetch_ticker_day
+from .polygon_client import aggregates_to_frame
+from .test_metrics import day_bars
+
+class MinuteBarsClient:
+    ''' Serves one frame of bars of one timespan, any other request fails the test '''
+
+    def __init__(self, frame, timespan='minute'):
+        self.frame = frame
+        self.timespan = timespan
+
+    def aggregates(self, symbol, timespan, start_date, end_date):
+        assert timespan == self.timespan, f'requested more than the {self.timespan} bars'
+        return self.frame
+
+def test_breakout_inputs():
+    bars = day_bars('FAST', '2023-03-03', [5] * 5 + [6, 7, 8, 7, 6] + [9, 10, 8])
+    inputs = breakout_inputs(bars, 'FAST', '2023-03-03')
+    assert inputs == {'five_mins_high': 8.0, 'vol_b4_bo': 1000, 'hod': '09:36:00'}
+
+@pytest.mark.parametrize('frame', [
+    # Opening halt: pre-market, then bars from 9:40
+    pd.concat([day_bars('HALT', '2023-03-03', [5] * 4, start='09:25'),
+               day_bars('HALT', '2023-03-03', [9, 10, 11], start='09:40')], ignore_index=True),
+    # Pre-market bars only, no market-hours high either
+    day_bars('HALT', '2023-03-03', [5] * 4, start='08:00'),
+    # No bars at all
+    day_bars('HALT', '2023-03-03', []),
+])
+def test_no_opening_candles(frame):
+    with pytest.raises(ValueError, match='HALT 2023-03-03: no 9:30-9:34 candles'):
+        breakout_inputs(frame, 'HALT', '2023-03-03')
+    # Rejected before the daily bars and reference data are requested
+    with pytest.raises(ValueError, match='no 9:30-9:34 candles'):
+        fetch_ticker_day(MinuteBarsClient(frame), 'HALT', '2023-03-02', '2023-03-03')
+
+@pytest.mark.parametrize('data', [{}, {'results': []}])
+def test_no_aggregates(data):
+    # A holiday, a wrong day or a delisted ticker: an empty frame of the bar schema
+    frame = aggregates_to_frame(data)
+    assert len(frame) == 0
+    assert frame['Date'].dt.tz is not None
+    assert {column: str(frame[column].dtype) for column in bars.BAR_DTYPES} == bars.BAR_DTYPES
+    with pytest.raises(ValueError, match='no daily aggregates for HALT on 2023-03-02'):
+        daily_inputs(MinuteBarsClient(frame, timespan='day'), 'HALT', '2023-03-02', '2023-03-03')
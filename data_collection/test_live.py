@@ -0,0 +1,31 @@
+''' BreakoutState bar by bar against hod_volbo_5mins_high. Run with python -m pytest '''
+import numpy as np
+import pandas as pd
+import pytest
+
+from . import bars
+from .live import BreakoutState
+from .metrics import hod_volbo_5mins_high
+from .test_metrics import day_bars
+
+def replay(frame):
+    state = BreakoutState()
+    for date, high, volume in zip(bars.wall_clock(frame['Date']), frame['High'], frame['Volume']):
+        state.update(date, high, volume)
+    return state.metrics()
+
+@pytest.mark.parametrize('highs, start', [
+    (10 + np.cumsum(np.random.default_rng(7).normal(0, 0.05, 960)).round(2), '04:00'),
+    ([5] * 5 + [9] * 5 + [8] * 20, '09:25'),
+    ([5] * 5 + [6, 7, 8, 7, 6] + [9, 10, 8], '09:25'),
+    # Bars from 9:36 only, no opening candles
+    ([9, 10, 11, 12], '09:36'),
+])
+def test_matches_vectorized(highs, start):
+    frame = day_bars('AAA', '2023-03-03', highs, start=start)
+    expected = hod_volbo_5mins_high(frame.drop(columns='ticker')).iloc[0]
+    live = replay(frame)
+    np.testing.assert_equal(live['five_mins_high'], float(expected['five_mins_high']))
+    assert live['hod'] == expected['hod']
+    assert (pd.isna(live['breakout']) and pd.isna(expected['breakout'])) or live['breakout'] == expected['breakout']
+    assert live['vol_b4_bo'] == expected['vol_b4_bo']
@@ -0,0 +1,86 @@
+''' hod_volbo_5mins_high against the row-wise computation it replaced, on small fixtures.
+Run with python -m pytest '''
+import numpy as np
+import pandas as pd
+import pytest
+
+from .metrics import hod_volbo_5mins_high
+
+def row_wise(voldata):
+    ''' The per ticker-day loop of the original bot: idxmax of the 9:30-9:34 and 9:30-16:00
+    candles, first candle from 9:35 above the 5mins high, and the volume before it.
+    A day without opening candles has no 5mins high and no breakout '''
+    rows = []
+    dates = voldata['Date'].dt.tz_localize(None)
+    for (ticker, day), bars in voldata.assign(wall=dates).groupby([voldata['ticker'], dates.dt.normalize()]):
+        bars = bars.sort_values('wall').reset_index(drop=True)
+        clock = bars['wall'] - day
+        opening = bars.loc[(clock >= pd.Timedelta('09:30:00')) & (clock < pd.Timedelta('09:35:00'))]
+        market = bars.loc[(clock >= pd.Timedelta('09:30:00')) & (clock <= pd.Timedelta('16:00:00'))]
+        after = bars.loc[(clock >= pd.Timedelta('09:35:00')) & (clock <= pd.Timedelta('16:00:00'))]
+        five_mins_high = opening.loc[opening['High'].idxmax(), 'High'] if len(opening) else np.nan
+        hod = market.loc[market['High'].idxmax(), 'wall'] if len(market) else pd.NaT
+        breakout, vol_b4_bo = pd.NaT, 0
+        for _, bar in after.iterrows():
+            if bar['High'] > five_mins_high:
+                breakout = bar['wall']
+                vol_b4_bo = int(bars.loc[bars['wall'] < breakout, 'Volume'].sum())
+                break
+        rows.append({'ticker': ticker, 'date': day, 'five_mins_high': five_mins_high, 'hod': hod,
+                     'breakout': breakout, 'vol_b4_bo': vol_b4_bo})
+    return pd.DataFrame(rows)
+
+def day_bars(ticker, day, highs, start='09:25', volume=100):
+    ''' 1min bars of one ticker-day from start, one per high '''
+    dates = pd.date_range(f'{day} {start}', periods=len(highs), freq='min', tz='US/Eastern')
+    return pd.DataFrame({'ticker': ticker, 'Date': dates, 'High': np.asarray(highs, dtype='float32'),
+                         'Volume': np.full(len(highs), volume, dtype='int64')})
+
+@pytest.fixture
+def random_days():
+    ''' Random walks of a few tickers over a few days, pre-market to post-market '''
+    rng = np.random.default_rng(7)
+    frames = []
+    for ticker in ['AAA', 'BBB', 'CCC']:
+        for day in ['2023-03-01', '2023-03-02', '2023-03-03']:
+            highs = 10 + np.cumsum(rng.normal(0, 0.05, 960)).round(2)
+            frame = day_bars(ticker, day, highs, start='04:00')
+            frame['Volume'] = rng.integers(1, 10_000, len(frame))
+            frames.append(frame)
+    # Rows out of order, as several tickers come back from the API
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=7)
+
+def compare(voldata):
+    expected = row_wise(voldata).sort_values(['ticker', 'date']).reset_index(drop=True)
+    result = hod_volbo_5mins_high(voldata).sort_values(['ticker', 'date']).reset_index(drop=True)
+    for column in ['date', 'hod', 'breakout']:
+        expected[column] = expected[column].astype('datetime64[ns]')
+        result[column] = result[column].astype('datetime64[ns]')
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+    return result
+
+def test_random_days(random_days):
+    result = compare(random_days)
+    assert len(result) == 9
+
+def test_no_opening_bars():
+    # A halt from 9:29 to 9:40: no 5mins high, so no breakout at 9:40 and no volume counted
+    bars = day_bars('HALT', '2023-03-03', [5, 6, 7, 8] + [9, 10, 11, 12], start='09:25')
+    bars['Date'] = bars['Date'].where(bars.index < 4, bars['Date'] + pd.Timedelta(minutes=11))
+    result = compare(bars).iloc[0]
+    assert np.isnan(result['five_mins_high'])
+    assert pd.isna(result['breakout']) and result['vol_b4_bo'] == 0
+
+def test_no_breakout():
+    bars = day_bars('FLAT', '2023-03-03', [5] * 5 + [9] * 5 + [8] * 20)
+    result = compare(bars).iloc[0]
+    assert result['five_mins_high'] == 9
+    assert pd.isna(result['breakout']) and result['vol_b4_bo'] == 0
+
+def test_breakout_on_first_candle_after_five_mins():
+    # 9:25-9:29 pre-market, 9:30-9:34 opening range, breakout on the 9:35 candle
+    bars = day_bars('FAST', '2023-03-03', [5] * 5 + [6, 7, 8, 7, 6] + [9, 10, 8])
+    result = compare(bars).iloc[0]
+    assert result['breakout'] == pd.Timestamp('2023-03-03 09:35')
+    assert result['vol_b4_bo'] == 10 * 100
+    assert result['hod'] == pd.Timestamp('2023-03-03 09:36')
@@ -0,0 +1,35 @@
+''' downsample_ohlc on hand-made bars. Run with python -m pytest '''
+import pandas as pd
+
+from .plot import downsample_ohlc
+
+def minute_bars(day, n, start='09:30'):
+    ''' n 1min bars of a flat 10.0 day from start '''
+    return pd.DataFrame({'Date': pd.date_range(f'{day} {start}', periods=n, freq='min', tz='US/Eastern'),
+                         'Open': 10.0, 'High': 10.0, 'Low': 10.0, 'Close': 10.0, 'Volume': 100})
+
+def test_keeps_high_and_low_of_merged_bars():
+    plot_data = minute_bars('2023-03-03', 100)
+    # A one minute spike and flush inside a bucket
+    plot_data.loc[37, 'High'] = 14.0
+    plot_data.loc[62, 'Low'] = 6.0
+    plot_data.loc[[0, 99], ['Open', 'Close']] = [9.5, 10.5]
+    result = downsample_ohlc(plot_data, max_bars=10)
+    assert len(result) == 10
+    assert result['High'].max() == 14.0 and result.loc[3, 'High'] == 14.0
+    assert result['Low'].min() == 6.0 and result.loc[6, 'Low'] == 6.0
+    assert result.loc[0, 'Open'] == 9.5 and result.loc[9, 'Close'] == 10.5
+    assert result['Volume'].sum() == plot_data['Volume'].sum()
+    assert result.loc[3, 'Date'] == plot_data.loc[30, 'Date']
+
+def test_buckets_do_not_span_days():
+    plot_data = pd.concat([minute_bars('2023-03-02', 15), minute_bars('2023-03-03', 15)], ignore_index=True)
+    plot_data.loc[15, 'Open'] = 12.0
+    result = downsample_ohlc(plot_data, max_bars=10)
+    # Buckets of 3 bars, 5 per day, the second day opens its own bucket
+    assert len(result) == 10
+    assert result.loc[5, 'Date'] == plot_data.loc[15, 'Date'] and result.loc[5, 'Open'] == 12.0
+
+def test_few_bars_unchanged():
+    plot_data = minute_bars('2023-03-03', 5)
+    assert downsample_ohlc(plot_data, max_bars=10) is plot_data
@@ -4,3 +4,18 @@ IPADDRESS = 'your_sql_Ip_address'
 PORT = your_sql_port
 DB_NAME = 'your_sql_database_name'
 API_KEY = 'polygon.io_api_key'
+# Polygon.io calls per minute allowed by your plan, None for no limit
+POLYGON_CALLS_PER_MINUTE = 5
+# Local cache of Polygon aggregates, set CACHE_DIR = None to disable it
+CACHE_DIR = '.cache/aggs'
+CACHE_MAX_MB = 2048
+# Seconds before cached bars of the current session are downloaded again
+CACHE_TTL_SECONDS = 60
+# Seconds after the 20:00 close before a day's bars are final and cached for good
+CACHE_SETTLE_SECONDS = 3600
+# Stored shares outstanding further than this many days from the entered date are downloaded again
+REFERENCE_MAX_AGE_DAYS = 30
+# Local Parquet mirror of primary_sheet and one_min_data, see python -m data_collection dataset
+DATASET_DIR = '.cache/dataset'
+# Pooled Postgres connections per process
+DB_POOL_SIZE = 5